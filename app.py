@@ -1,8 +1,34 @@
+import hashlib
+import os
+
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html, Input, Output
+import diskcache
+from dash import dcc, html, Input, Output, DiskcacheManager
 from dash_extensions.enrich import DashProxy
-from flask import Flask, redirect
+from flask import Flask, Response, abort, jsonify, redirect, request, send_file
+
+import compression
+import janitor
+import jobs
+import metrics
+import previews
+from core.qr_codes import qr_png, qr_svg, qr_query_options
+from utils import read_asset_manifest
+
+JOBS_CACHE = os.environ.get("JOBS_CACHE", "./cache/jobs")
+
+# built by build_assets.py, the CDN copies are only used when no local build exists
+ASSETS = read_asset_manifest()
+FINGERPRINTED_ASSETS = set(ASSETS.values())
+EXTERNAL_SCRIPTS = [
+    ASSETS.get("jsoneditor.min.js", 'https://cdnjs.cloudflare.com/ajax/libs/jsoneditor/10.1.3/jsoneditor.min.js'),
+] + ([] if "tailwind.css" in ASSETS else ['https://cdn.tailwindcss.com'])
+EXTERNAL_STYLESHEETS = [
+    ASSETS.get("bootstrap.min.css", dbc.themes.BOOTSTRAP),
+    ASSETS.get("bootstrap-icons.min.css", dbc.icons.BOOTSTRAP),
+    ASSETS.get("jsoneditor.min.css", 'https://cdnjs.cloudflare.com/ajax/libs/jsoneditor/10.1.3/jsoneditor.min.css'),
+] + ([ASSETS["tailwind.css"]] if "tailwind.css" in ASSETS else [])
 
 server = Flask(__name__)
 
@@ -12,22 +38,89 @@ def redirect_root():
     return redirect('/xml')
 
 
+@server.route('/qr.<fmt>')
+def qr(fmt):
+    if fmt not in ("png", "svg"):
+        abort(404)
+
+    try:
+        payload, options = qr_query_options(request.args)
+    except ValueError:
+        abort(400)
+    if not payload:
+        abort(400)
+
+    etag = hashlib.sha1(repr((fmt, payload, options)).encode("utf-8")).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+    try:
+        if fmt == "png":
+            response = Response(qr_png(payload, options), mimetype="image/png")
+        else:
+            response = Response(qr_svg(payload, options), mimetype="image/svg+xml")
+    except ValueError:
+        # larger than MAX_QR_PIXELS
+        abort(400)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
+
+
+@server.route(f'{jobs.JOB_URL}/<token>/<filename>')
+def download_job_result(token, filename):
+    path = jobs.job_result(token, filename)
+    if path is None:
+        abort(404)
+    janitor.touch(path)
+    return send_file(path, as_attachment=True, download_name=filename)
+
+
+@server.route(f'{previews.PREVIEW_URL}/<digest>.<ext>')
+def preview(digest, ext):
+    path = previews.preview_file(digest, ext)
+    if path is None:
+        abort(404)
+    janitor.touch(path)
+    # the digest is the content hash, so it doubles as a strong etag
+    response = send_file(path, mimetype=previews.PREVIEW_TYPES[ext], etag=digest, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@server.route('/janitor')
+def janitor_stats():
+    return jsonify(janitor.stats())
+
+
+@server.after_request
+def cache_build_assets(response):
+    # only the manifest entries carry a content hash in their name, the copied fonts/ and img/ folders
+    # keep their upstream names and are revalidated like any other static file
+    if request.path in FINGERPRINTED_ASSETS and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    return response
+
+
 app = DashProxy(
     __name__,
-    external_scripts=[
-        'https://cdn.tailwindcss.com',
-        'https://cdnjs.cloudflare.com/ajax/libs/jsoneditor/10.1.3/jsoneditor.min.js',
-    ],
-    external_stylesheets=[
-        dbc.themes.BOOTSTRAP,
-        dbc.icons.BOOTSTRAP,
-        'https://cdnjs.cloudflare.com/ajax/libs/jsoneditor/10.1.3/jsoneditor.min.css'
-    ],
+    external_scripts=EXTERNAL_SCRIPTS,
+    external_stylesheets=EXTERNAL_STYLESHEETS,
     use_pages=True,
-    server=server
+    server=server,
+    # long exports run in separate processes so they neither block a worker nor hit its timeout
+    background_callback_manager=DiskcacheManager(diskcache.Cache(JOBS_CACHE)),
 )
 
 server = app.server
+janitor.start()
+metrics.instrument(app)
+compression.install(server)
 
 app.layout = dbc.Container([dbc.Container([
     dbc.Row([
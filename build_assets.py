@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from utils import BUILD_FOLDER, ASSET_MANIFEST
+
+NODE_MODULES = "./node_modules"
+TAILWIND_INPUT = "./frontend/tailwind.css"
+
+# logical name -> file in node_modules, folders are copied next to the css that references them
+VENDOR_FILES = {
+    "bootstrap.min.css": "bootstrap/dist/css/bootstrap.min.css",
+    "bootstrap-icons.min.css": "bootstrap-icons/font/bootstrap-icons.min.css",
+    "jsoneditor.min.js": "jsoneditor/dist/jsoneditor.min.js",
+    "jsoneditor.min.css": "jsoneditor/dist/jsoneditor.min.css",
+}
+VENDOR_FOLDERS = {
+    "fonts": "bootstrap-icons/font/fonts",
+    "img": "jsoneditor/dist/img",
+}
+
+
+def fingerprint(path: str, name: str) -> str:
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:10]
+    stem, ext = name.split(".", 1)
+    target = f"{stem}.{digest}.{ext}"
+    shutil.copyfile(path, os.path.join(BUILD_FOLDER, target))
+    return target
+
+
+def build_tailwind(output: str):
+    subprocess.run(
+        ["npx", "--no-install", "tailwindcss", "-c", "tailwind.config.js", "-i", TAILWIND_INPUT, "-o", output, "--minify"],
+        check=True,
+    )
+
+
+def build() -> dict[str, str]:
+    if not os.path.isdir(NODE_MODULES):
+        raise FileNotFoundError("node_modules not found, run `npm install` first")
+
+    shutil.rmtree(BUILD_FOLDER, ignore_errors=True)
+    os.makedirs(BUILD_FOLDER)
+
+    manifest = {}
+    tailwind_output = os.path.join(BUILD_FOLDER, "tailwind.tmp.css")
+    build_tailwind(tailwind_output)
+    manifest["tailwind.css"] = fingerprint(tailwind_output, "tailwind.css")
+    os.remove(tailwind_output)
+
+    for name, path in VENDOR_FILES.items():
+        manifest[name] = fingerprint(os.path.join(NODE_MODULES, path), name)
+    for folder, path in VENDOR_FOLDERS.items():
+        shutil.copytree(os.path.join(NODE_MODULES, path), os.path.join(BUILD_FOLDER, folder))
+
+    with open(ASSET_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+if __name__ == '__main__':
+    try:
+        for name, target in build().items():
+            print(f"{name} -> {target}")
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,105 @@
+import gzip
+import os
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# smaller bodies are not worth the cpu, the headers alone are a few hundred bytes
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+# static bodies above this are streamed as they are instead of being read into memory
+COMPRESS_MAX_BYTES = int(os.environ.get("COMPRESS_MAX_BYTES", 32 * 1024 ** 2))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+# brotli's higher qualities are far too slow for per-request use
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 4))
+# compressed copies of responses that are the same on every request (dash bundles, static files, qr svgs)
+CACHE_ENTRIES = int(os.environ.get("COMPRESS_CACHE_ENTRIES", 64))
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def compressible(mimetype: str | None) -> bool:
+    return bool(mimetype) and (mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES)
+
+
+def choose_encoding(accept_encodings) -> str | None:
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime is fixed so equal bodies compress to equal bytes
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_cached(key, data: bytes, encoding: str) -> bytes:
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    body = compress(data, encoding)
+    with _lock:
+        _cache[key] = body
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return body
+
+
+def compress_response(response):
+    if response.status_code != 200 or "Content-Encoding" in response.headers or "Range" in request.headers:
+        return response
+    if not compressible(response.mimetype):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.direct_passthrough:
+        # files from send_file are streamed, only read the ones small enough to hold in memory
+        if response.content_length is None or response.content_length > COMPRESS_MAX_BYTES:
+            return response
+        response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag:
+        body = compress_cached((request.full_path, etag, encoding), data, encoding)
+        # the compressed body is a different representation of the same resource
+        response.set_etag(etag, weak=True)
+    elif response.cache_control.max_age:
+        # dash serves its fingerprinted bundles with a long max-age and no etag
+        body = compress_cached((request.full_path, None, encoding), data, encoding)
+    else:
+        body = compress(data, encoding)
+    if len(body) >= len(data):
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def install(server):
+    # registered after the other hooks so it runs first and they see the bytes actually sent
+    server.after_request(compress_response)
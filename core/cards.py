@@ -0,0 +1,277 @@
+import copy
+import re
+import unicodedata
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+from core.players import GLOBAL_CONTEXT, generate_name
+from core.qr_codes import qr_bitmap
+from utils import hex_to_rgb, lazy_import
+
+mako_template = lazy_import("mako.template")
+
+DEFAULT_FONT = "./Roboto.ttf"
+HEX_COLOR_PATTERN = r'#(?:[A-Fa-f0-9]{3}|[A-Fa-f0-9]{6}|[A-Fa-f0-9]{4}|[A-Fa-f0-9]{8})\b'
+
+
+def draw_text(img: Image, row: dict, row_config: dict, config: dict) -> Image:
+    if not row:
+        return img
+    try:
+        text = mako_template.Template(row_config["template"]).render(**generate_name(row))
+    except NameError:
+        text = row_config["template"]
+    if not text:
+        return img
+    text = unicodedata.normalize('NFC', text)
+
+    img = img.copy()
+    row_config = copy.deepcopy(row_config)
+    d = ImageDraw.Draw(img)
+
+    font_path = config["font"] if config.get("font", None) else DEFAULT_FONT
+    font_size = row_config["maxFontSize"]
+    try:
+        font = ImageFont.truetype(font_path, font_size)
+    except OSError:
+        font_path = DEFAULT_FONT
+        font = ImageFont.truetype(font_path, font_size)
+    while d.textlength(text, font) >= row_config["maxWidth"]:
+        font_size -= 1
+        row_config["maxWidth"] = row_config["maxWidth"] * row_config["maxWidthCompensate"]
+        row_config["offsetX"] = row_config["offsetX"] * row_config["offsetXCompensate"]
+        row_config["offsetY"] = row_config["offsetY"] * row_config["offsetYCompensate"]
+        font = ImageFont.truetype(font_path, font_size)
+
+    center = img.width // 2, img.height // 2
+    center = (
+        center[0] + row_config["offsetX"],
+        center[1] + row_config["offsetY"]
+    )
+
+    if row_config["border"]["strokeWeight"] > 0:
+        left, top, right, bottom = d.textbbox(center, text, font=font, anchor=row_config["anchor"])
+        color = mako_template.Template(row_config["border"]["color"]).render(**generate_name(row), **GLOBAL_CONTEXT)
+        box = [
+            left - row_config["border"]["padding"]["left"],
+            top - row_config["border"]["padding"]["top"],
+            right + row_config["border"]["padding"]["right"],
+            bottom + row_config["border"]["padding"]["bottom"]
+        ]
+
+        if row_config["border"]["minWidth"] > 0 and (box[2] - box[0]) < row_config["border"]["minWidth"]:
+            min_width = row_config["border"]["minWidth"]
+            if row_config["anchor"][0] == "l":
+                box[2] += min_width - (box[2] - box[0])
+            elif row_config["anchor"][0] == "r":
+                box[0] -= min_width - (box[2] - box[0])
+            else:
+                center_x = (box[0] + box[2]) // 2
+                half_width = min_width // 2
+                box[0] = center_x - half_width
+                box[2] = center_x + (min_width - half_width)
+        if row_config["border"]["minHeight"] > 0 and (box[3] - box[1]) < row_config["border"]["minHeight"]:
+            min_height = row_config["border"]["minHeight"]
+            if row_config["anchor"][1] == "t":
+                box[3] += min_height - (box[3] - box[1])
+            elif row_config["anchor"][1] == "b":
+                box[1] -= min_height - (box[3] - box[1])
+            else:
+                center_y = (box[1] + box[3]) // 2
+                half_height = min_height // 2
+                box[1] = center_y - half_height
+                box[3] = center_y + (min_height - half_height)
+
+        d.rounded_rectangle(
+            box,
+            outline=color,
+            width=row_config["border"]["strokeWeight"],
+            fill=None if not row_config["border"]["fill"] else mako_template.Template(row_config["border"]["fill"]).render(**generate_name(row), **GLOBAL_CONTEXT),
+            radius=row_config["border"]["radius"]
+        )
+
+    try:
+        d.text(center, text, fill=mako_template.Template(row_config["color"]).render(**generate_name(row), **GLOBAL_CONTEXT), anchor=row_config["anchor"], font=font)
+    except NameError:
+        d.text(center, text, fill="#000000", anchor=row_config["anchor"], font=font)
+
+    return img
+
+
+def qr_position(center: tuple, size: int, anchor: str) -> tuple[int, int]:
+    x, y = center
+    if anchor[0] == "m":
+        x -= size / 2
+    elif anchor[0] == "r":
+        x -= size
+    if anchor[1] == "m":
+        y -= size / 2
+    elif anchor[1] in ("b", "d", "s"):
+        y -= size
+    return int(x), int(y)
+
+
+def draw_qr(img: Image, row: dict, row_config: dict, config: dict) -> Image:
+    if not row:
+        return img
+    try:
+        payload = mako_template.Template(row_config["template"]).render(**generate_name(row), **GLOBAL_CONTEXT).strip()
+    except NameError:
+        payload = ""
+    if not payload:
+        return img
+
+    try:
+        fill_color = mako_template.Template(row_config.get("color", "#000000")).render(**generate_name(row), **GLOBAL_CONTEXT)
+        back_color = mako_template.Template(row_config.get("backColor", "#FFFFFF")).render(**generate_name(row), **GLOBAL_CONTEXT)
+    except NameError:
+        fill_color, back_color = "#000000", "#FFFFFF"
+
+    size = int(row_config.get("size", 120))
+    bitmap = qr_bitmap(payload, size, fill_color or "black", back_color or "white", int(row_config.get("border", 1)))
+    center = (
+        img.width // 2 + row_config.get("offsetX", 0),
+        img.height // 2 + row_config.get("offsetY", 0)
+    )
+
+    x, y = qr_position(center, size, row_config.get("anchor", "mm"))
+    source = max(0, -x), max(0, -y)
+    if source[0] >= size or source[1] >= size or x >= img.width or y >= img.height:
+        return img
+
+    img = img.copy()
+    img.alpha_composite(bitmap, (max(x, 0), max(y, 0)), source)
+    return img
+
+
+def draw_layer(img: Image, row: dict, row_config: dict, config: dict) -> Image:
+    if row_config.get("type", "text") == "qr":
+        return draw_qr(img, row, row_config, config)
+    return draw_text(img, row, row_config, config)
+
+
+def card_base(template: str, conf: dict) -> Image:
+    scale = conf.get("scale", {}) or {}
+    with Image.open(template) as im:
+        base = im.convert("RGBA")
+
+    target_w = int(scale.get("width") or 0)
+    target_h = int(scale.get("height") or 0)
+    if target_w > 0 and target_h > 0:
+        base = base.resize((target_w, target_h), Image.LANCZOS)
+    elif target_w > 0:
+        new_h = max(1, round(base.height * (target_w / base.width)))
+        base = base.resize((target_w, new_h), Image.LANCZOS)
+    elif target_h > 0:
+        new_w = max(1, round(base.width * (target_h / base.height)))
+        base = base.resize((new_w, target_h), Image.LANCZOS)
+    return base
+
+
+def render_card(base: Image, config: dict, row: dict) -> bytes:
+    conf = config.get("config", {})
+    dpi_cfg = conf.get("dpi", {}) or {}
+    dpi = (int(dpi_cfg.get("width", 72)), int(dpi_cfg.get("height", 72)))
+
+    overlay = Image.new("RGBA", base.size, (255, 255, 255, 0))
+    for k, value in config.items():
+        if k != "config":
+            overlay = draw_layer(overlay, row, value, conf)
+
+    out = BytesIO()
+    Image.alpha_composite(base, overlay).convert("RGB").save(out, format=conf.get("outputFormat", "png"), dpi=dpi)
+    return out.getvalue()
+
+
+def template_png(template: str) -> bytes:
+    image = Image.open(template).convert("RGBA")
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def render_preview(template: str, config: dict, preview: str, data: list[dict]) -> bytes:
+    # preview "0" outlines where every layer goes, a player id renders that player's card
+    image = Image.open(template).convert("RGBA")
+    if config["config"]["scale"]["width"] > 0 and config["config"]["scale"]["height"] > 0:
+        image = image.resize((config["config"]["scale"]["width"], config["config"]["scale"]["height"]))
+    elif config["config"]["scale"]["width"] > 0:
+        image.thumbnail((config["config"]["scale"]["width"], image.height))
+    elif config["config"]["scale"]["height"] > 0:
+        image.thumbnail((image.width, config["config"]["scale"]["height"]))
+    overlay = Image.new("RGBA", image.size, (255, 255, 255, 0))
+
+    d = ImageDraw.Draw(image)
+    if preview == "0":
+        d.line(((0, image.height // 2), (image.width, image.height // 2)), "gray")
+        d.line(((image.width // 2, 0), (image.width // 2, image.height)), "gray")
+
+    d = ImageDraw.Draw(overlay)
+
+    groups = {}
+    font_path = config["config"].get("font", None) or DEFAULT_FONT
+    for k, value in config.items():
+        if k == "config":
+            continue
+
+        if preview == "0" and value.get("type", "text") == "qr":
+            if not value.get("template"):
+                continue
+            size = int(value.get("size", 120))
+            left, top = qr_position((image.width // 2 + value.get("offsetX", 0), image.height // 2 + value.get("offsetY", 0)), size, value.get("anchor", "mm"))
+            color = re.search(HEX_COLOR_PATTERN, value.get("color", ""))
+            d.rectangle(
+                [left, top, left + size, top + size],
+                fill=hex_to_rgb(color.group() if color else "#000000") + (128,),
+                outline=hex_to_rgb(color.group() if color else "#000000")
+            )
+            if value.get("groupId", None):
+                groups.setdefault(value["groupId"], []).append((left, top, left + size, top + size))
+        elif preview == "0":
+            center = image.width // 2, image.height // 2
+            center = (
+                center[0] + value["offsetX"],
+                center[1] + value["offsetY"]
+            )
+            text = ""
+            font = ImageFont.truetype(font_path, value["maxFontSize"])
+            while d.textlength(text, font) < value["maxWidth"]:
+                text += "A"
+            left, top, right, bottom = d.textbbox(center, text, font=font, anchor=value["anchor"])
+            color = re.search(HEX_COLOR_PATTERN, value["color"])
+            d.rectangle(
+                [left, top, right, bottom],
+                fill=hex_to_rgb(color.group() if color else "#000000") + (128,),
+                outline=hex_to_rgb(color.group() if color else "#000000")
+            )
+            if value.get("groupId", None):
+                groups.setdefault(value["groupId"], []).append((left, top, right, bottom))
+        else:
+            row = next((r for r in data if r.get("PlayerUniqueId") == int(preview)), None)
+            overlay = draw_layer(overlay, row, value, config["config"])
+
+    for group in groups.values():
+        if preview != "0" or len(group) == 1:
+            continue
+        if len(group) > 1:
+            left = min(x[0] for x in group)
+            top = min(x[1] for x in group)
+            right = max(x[2] for x in group)
+            bottom = max(x[3] for x in group)
+            d.rectangle(
+                [left, top, right, bottom],
+                outline="red",
+                width=3
+            )
+
+    image = Image.alpha_composite(image, overlay).convert("RGB")
+    image.thumbnail((1200, 1200))
+
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+def card_filename(config: dict, row: dict) -> str:
+    return f"player_card_#{row['PlayerUniqueId']}.{config.get('config', {}).get('outputFormat', 'png')}"
@@ -0,0 +1,284 @@
+import csv
+import random
+import re
+import unicodedata
+import xml.dom.minidom
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from io import BytesIO, StringIO
+from operator import itemgetter
+
+from toolz import unique
+
+from core.standings import HEADER_ALIASES
+from utils import contains_vietnamese, fold_text, lazy_import
+
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+mako_template = lazy_import("mako.template")
+
+FIELDS = {
+    "PlayerUniqueId": "Id",
+    "Name": "Name",
+    "Lastname": "Last Name",
+    "Firstname": "First Name",
+    "Gender": "Gender",
+    "Group": "Group",
+    "Rating": "Rating",
+    "Title": "Title",
+    "Federation": "Federation",
+    "FIDEId": "FIDE Id",
+    "Club": "Club",
+    "TeamUniqueId": "Team Id",
+    "Type": "Type",
+}
+FIELD_BY_LABEL = {v: k for k, v in FIELDS.items()}
+# the rest are derived from the name and the row order
+IMPORT_FIELDS = {k: v for k, v in FIELDS.items() if k not in ("PlayerUniqueId", "Firstname", "Lastname")}
+EXPORT_COLUMNS = {**FIELDS, "duplicate": "Duplicate", "localized": "Localized"}
+
+GLOBAL_CONTEXT = {
+    "datetime": datetime,
+    "random": random,
+}
+
+
+def generate_name(data: dict) -> dict:
+    return data | {k.lower(): v for k, v in data.items()} | {FIELDS[k].lower().replace(" ", "_"): v for k, v in data.items() if k in FIELDS}
+
+
+def split_name(name: str) -> tuple[str, str]:
+    name = re.sub(r"\(.*\)", '', unicodedata.normalize('NFC', name)).strip().replace(",", "")
+    name = ' '.join(map(lambda s: s.capitalize(), name.lower().split())).split()
+
+    if not name:
+        return "", ""
+    if len(name) == 1:
+        return "", name[0]
+    return name[0], " ".join(name[1:])
+
+
+def normalize_players(data: list[dict]) -> list[dict]:
+    name_dict = dict()
+    for i, row in enumerate(data):
+        for k, v in row.items():
+            row[k] = v.strip().replace("\n", " ") if isinstance(v, str) else v
+
+        row["PlayerUniqueId"] = i + 1
+        if row.get("Name", None):
+            row["Lastname"], row["Firstname"] = split_name(row["Name"])
+        else:
+            row["Lastname"], row["Firstname"] = "", ""
+
+        if not contains_vietnamese(f"{row['Lastname']} {row['Firstname']}"):
+            row["localized"] = "true"
+
+        row["duplicate"] = "false"
+        if f"{row['Lastname']} {row['Firstname']}" in name_dict:
+            row["duplicate"] = "true"
+            name_dict[f"{row['Lastname']} {row['Firstname']}"]["duplicate"] = "true"
+        else:
+            name_dict[f"{row['Lastname']} {row['Firstname']}"] = row
+
+    return data
+
+
+def apply_formulas(data: list[dict]) -> list[dict]:
+    # "=" cells in the last row are mako templates rendered into every row above it
+    if len(data) <= 1:
+        return data
+
+    for k, v in data[-1].items():
+        v = str(v)
+        if v.startswith("=") and k not in ("Name", "Lastname", "Firstname"):
+            v = v[1:]
+            for row in data[:-1]:
+                try:
+                    row[k] = mako_template.Template(v).render(**generate_name(row), **GLOBAL_CONTEXT)
+                except Exception:
+                    try:
+                        row[k] = mako_template.Template(v + "}").render(**generate_name(row), **GLOBAL_CONTEXT)
+                    except Exception as e:
+                        if "NameError" in str(e) or "SyntaxException" in str(e):
+                            row[k] = v
+                        else:
+                            row[k] = "#ERROR"
+                            raise e
+
+    return data
+
+
+def group_counts(data: list[dict]) -> dict[str, int]:
+    group = dict()
+    for row in data:
+        if row.get("Group", None):
+            group[row["Group"]] = group.get(row["Group"], 0) + 1
+    return group
+
+
+def fill_groups(data: list[dict]) -> list[dict]:
+    for row in data:
+        if row.get("Gender", None):
+            match row.get("Gender", "").strip().lower():
+                case "m" | "male" | "man" | "nam":
+                    row["Group"] = "m"
+                case "f" | "female" | "women" | "nu" | "nữ":
+                    row["Group"] = "f"
+        else:
+            row["Group"] = "m"
+
+    return data
+
+
+def number_teams(data: list[dict]) -> list[dict]:
+    data = [row for row in data if any(row.values())]
+
+    temp = [row for row in data if row.get("Federation", None) == ""]
+    data = list(unique(sorted([row for row in data if row.get("Federation", None) != ""],
+                              key=lambda x: sum(v is None for v in x.values())),
+                       key=lambda x: x.get("Federation", "")))
+
+    data = data + temp
+
+    for i, row in enumerate(data):
+        row["TeamUniqueId"] = i + 1
+
+    return data
+
+
+def teams_from_players(data: list[dict]) -> list[dict]:
+    teams = {}
+    for row in data:
+        if row.get("Federation", None):
+            teams.setdefault(row["Federation"], row.get("Club", "") or "")
+    return number_teams([{"Federation": k, "Club": v} for k, v in sorted(teams.items())])
+
+
+def fill_from_teams(data: list[dict], teams: list[dict], key: str, field: str) -> list[dict]:
+    mapping = {row[key]: row[field] for row in teams if row.get(key, None) and row.get(field, None)}
+
+    for row in data:
+        if row.get(key, None):
+            row[field] = mapping.get(row[key], "")
+
+    return data
+
+
+def generate_players_xml(data: list[dict], group: str | None = None) -> str:
+    root = ET.Element('Players')
+    for row in data:
+        if group:
+            if row.get("Group", None) != group:
+                continue
+
+        player = ET.SubElement(root, 'Player')
+        for k, v in row.items():
+            if not v or not k or k == "Name" or k not in FIELDS:
+                continue
+            player.set(k, str(v))
+
+    tree = ET.ElementTree(root)
+    result_str = ET.tostring(tree.getroot(), encoding="utf8").decode("utf8")
+
+    dom = xml.dom.minidom.parseString(result_str)
+    pretty_xml_as_string = dom.toprettyxml()
+
+    return pretty_xml_as_string
+
+
+def generate_teams_xml(data: list[dict]) -> str:
+    data = sorted([row for row in data if row.get("TeamUniqueId", None)], key=itemgetter("TeamUniqueId"))
+
+    root = ET.Element('Teams')
+    for row in data:
+        team = ET.SubElement(root, 'Team')
+        team.set("TeamLongname", row.get("Club", ""))
+        team.set("TeamShortname", row.get("Federation", ""))
+        team.set("TeamUniqueId", str(row.get("TeamUniqueId", "")))
+
+    tree = ET.ElementTree(root)
+    result_str = ET.tostring(tree.getroot(), encoding="utf8").decode("utf8")
+
+    dom = xml.dom.minidom.parseString(result_str)
+    pretty_xml_as_string = dom.toprettyxml()
+
+    return pretty_xml_as_string
+
+
+def export_players(data: list[dict], file_format: str = "xlsx") -> bytes:
+    # empty cells are left out of the sheet entirely
+    rows = ([None if row.get(k, "") == "" else row[k] for k in EXPORT_COLUMNS] for row in data if row.get("Name", None))
+
+    if file_format == "csv":
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS.values())
+        writer.writerows(rows)
+        # BOM so that Excel detects utf-8 for localized names
+        return buffer.getvalue().encode("utf-8-sig")
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Players")
+    # column widths have to be set before the first row in write only mode
+    for i, (k, v) in enumerate(EXPORT_COLUMNS.items()):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(i + 1)].width = 30 if k == "Name" else max(len(v), 10) + 3
+    ws.append(list(EXPORT_COLUMNS.values()))
+    for row in rows:
+        ws.append(row)
+
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def import_rows(rows: list[dict]) -> list[dict] | None:
+    # the first row holds the field label picked for each column, a label picked twice is ambiguous
+    header, rows = rows[0], rows[1:]
+    labels = [v for v in header.values() if v]
+    if len(labels) != len(set(labels)):
+        return None
+
+    columns = {col: FIELD_BY_LABEL[label] for col, label in header.items() if label and label in FIELD_BY_LABEL}
+    return [{field: "" if row.get(col) is None else row[col] for col, field in columns.items()} for row in rows]
+
+
+def fill_rows(rows: list[dict]) -> list[dict]:
+    # every row gets every column, blanks as "" so templates can use them
+    return [row for row in pd.DataFrame(rows).fillna("").to_dict(orient="records") if any(v != "" for v in row.values())]
+
+
+def read_rows(content: bytes, filename: str) -> list[dict]:
+    df = pd.read_csv(BytesIO(content)) if filename.lower().endswith(".csv") else pd.read_excel(BytesIO(content))
+    return fill_rows(df.to_dict(orient="records"))
+
+
+def read_excel(content: bytes, sheet: str | None) -> "pd.DataFrame | dict[str, pd.DataFrame]":
+    return pd.read_excel(BytesIO(content), sheet_name=sheet)
+
+
+def read_players(content: bytes, filename: str, sheet: str | None = None) -> "pd.DataFrame":
+    if filename.lower().endswith(".csv"):
+        return pd.read_csv(BytesIO(content), encoding="utf-8-sig", dtype=str)
+    data = read_excel(content, sheet)
+    return next(iter(data.values())) if isinstance(data, dict) else data
+
+
+def guess_columns(columns, overrides: dict | None = None) -> dict:
+    # headers named like a field, its label or a Swiss-Manager header, in any case or accents, map to that field
+    keys = {alias: field for key, field in (("name", "Name"), ("federation", "Federation"), ("team", "Club")) for alias in HEADER_ALIASES[key]}
+    keys |= {fold_text(k): k for k in IMPORT_FIELDS} | {fold_text(v): k for k, v in IMPORT_FIELDS.items()}
+    mapping = {col: field for col, field in (overrides or {}).items() if col in columns}
+    for col in columns:
+        field = keys.get(fold_text(col))
+        if col not in mapping and field and field not in mapping.values():
+            mapping[col] = field
+    return mapping
+
+
+def rename_columns(df: "pd.DataFrame", mapping: dict) -> list[dict]:
+    df = df[[col for col in mapping if col in df.columns]].rename(columns=mapping)
+    # pandas reads integer columns with blanks as floats, FIDE ids and ratings should not end up as 1234567.0
+    return [
+        {k: int(v) if isinstance(v, float) and v.is_integer() else v for k, v in row.items()}
+        for row in df.fillna("").to_dict("records")
+    ]
@@ -0,0 +1,257 @@
+import os
+import threading
+import zipfile
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+from xml.sax.saxutils import quoteattr
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from utils import lazy_import
+
+numpy = lazy_import("numpy")
+qrcode = lazy_import("qrcode")
+mako_template = lazy_import("mako.template")
+mako_exceptions = lazy_import("mako.exceptions")
+
+# below this many distinct payloads a process pool costs more than it saves
+POOL_THRESHOLD = 64
+
+SHEET_SIZE = (1240, 1754)  # A4 at 150 dpi
+SHEET_DPI = 150
+SHEET_COLUMNS = 4
+SHEET_ROWS = 5
+SHEET_MARGIN = 60
+SHEET_LABEL_SIZE = 22
+
+# a url can ask for any version, box size and border, so renders are bounded in pixels and the cache,
+# which also holds the card bitmaps, in bytes
+MAX_QR_PIXELS = int(os.environ.get("MAX_QR_PIXELS", 4096))
+QR_CACHE_BYTES = int(os.environ.get("QR_CACHE_BYTES", 32 * 1024 ** 2))
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_bytes = 0
+
+
+def qr_options(size, box_size, border, fill_color, back_color, fill_color_transparent, back_color_transparent) -> tuple:
+    return (
+        size,
+        box_size,
+        border,
+        (fill_color if fill_color else "black") if not fill_color_transparent else "transparent",
+        (back_color if back_color else "white") if not back_color_transparent else "transparent",
+    )
+
+
+def make_qr(payload: str, version: int | None = None, box_size: int = 20, border: int = 0) -> "qrcode.QRCode":
+    qr = qrcode.QRCode(
+        version=version if version and (version > 0) else None,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=box_size if box_size and (box_size > 0) else 20,
+        border=border if border and (border > 0) else 0,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr
+
+
+def qr_matrix(qr: "qrcode.QRCode") -> list:
+    matrix = qr.get_matrix()
+    if len(matrix) * qr.box_size > MAX_QR_PIXELS:
+        raise ValueError(f"QR code would be {len(matrix) * qr.box_size} pixels wide, the limit is {MAX_QR_PIXELS}")
+    return matrix
+
+
+def rgba(color: str) -> tuple[int, int, int, int]:
+    if color == "transparent":
+        return 0, 0, 0, 0
+    return ImageColor.getcolor(color, "RGBA")
+
+
+def rasterize(matrix, box_size: int, fill_color: str = "black", back_color: str = "white") -> "numpy.ndarray":
+    # get_matrix already includes the quiet zone, so only the box size has to be applied
+    palette = numpy.array([rgba(back_color), rgba(fill_color)], dtype=numpy.uint8)
+    modules = palette[numpy.asarray(matrix, dtype=numpy.intp)]
+    return modules.repeat(box_size, axis=0).repeat(box_size, axis=1)
+
+
+def qr_image(
+        payload: str,
+        version: int | None = None,
+        box_size: int = 20,
+        border: int = 0,
+        fill_color: str = "black",
+        back_color: str = "white",
+) -> Image.Image:
+    qr = make_qr(payload, version, box_size, border)
+    return Image.fromarray(rasterize(qr_matrix(qr), qr.box_size, fill_color, back_color), "RGBA")
+
+
+def cached(key: tuple, render, size=len):
+    global _cache_bytes
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key][0]
+    data = render()
+    with _cache_lock:
+        if key not in _cache:
+            _cache[key] = (data, size(data))
+            _cache_bytes += _cache[key][1]
+        while _cache_bytes > QR_CACHE_BYTES and _cache:
+            _cache_bytes -= _cache.popitem(last=False)[1][1]
+    return data
+
+
+def render_png(payload: str, options: tuple = ()) -> bytes:
+    buffer = BytesIO()
+    qr_image(payload, *options).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def qr_png(payload: str, options: tuple = ()) -> bytes:
+    return cached(("png", payload, tuple(options)), lambda: render_png(payload, options))
+
+
+def render_bitmap(payload: str, size: int, fill_color: str = "black", back_color: str = "white", border: int = 0) -> Image.Image:
+    matrix = make_qr(payload, None, 1, border).get_matrix()
+    box_size = max(1, -(-size // len(matrix)))
+    img = Image.fromarray(rasterize(matrix, box_size, fill_color, back_color), "RGBA")
+    return img if img.width == size else img.resize((size, size), Image.NEAREST)
+
+
+def qr_bitmap(payload: str, size: int, fill_color: str = "black", back_color: str = "white", border: int = 0) -> Image.Image:
+    # shared between cards, callers must not draw on the returned image
+    return cached(
+        ("bitmap", payload, size, fill_color, back_color, border),
+        lambda: render_bitmap(payload, size, fill_color, back_color, border),
+        size=lambda img: img.width * img.height * len(img.getbands()),
+    )
+
+
+def render_svg(payload: str, options: tuple = ()) -> bytes:
+    version, box_size, border, fill_color, back_color = (tuple(options) + (None, 20, 0, "black", "white")[len(options):])
+    qr = make_qr(payload, version, box_size, border)
+    matrix = qr_matrix(qr)
+    size = len(matrix) * qr.box_size
+
+    modules = "".join(f"M{x},{y}h1v1h-1z" for y, line in enumerate(matrix) for x, dark in enumerate(line) if dark)
+    back = "" if back_color == "transparent" else f'<rect width="100%" height="100%" fill={quoteattr(back_color)}/>'
+    fill = "none" if fill_color == "transparent" else fill_color
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {len(matrix)} {len(matrix)}" shape-rendering="crispEdges">'
+        f'{back}<path d="{modules}" fill={quoteattr(fill)}/></svg>'
+    ).encode("utf-8")
+
+
+def qr_svg(payload: str, options: tuple = ()) -> bytes:
+    return cached(("svg", payload, tuple(options)), lambda: render_svg(payload, options))
+
+
+def qr_query(payload: str, options: tuple) -> str:
+    version, box_size, border, fill_color, back_color = options
+    return urlencode({
+        "text": payload or "",
+        "version": version or 0,
+        "box_size": box_size or 20,
+        "border": border or 0,
+        "fill": fill_color,
+        "back": back_color,
+    })
+
+
+def qr_query_options(args) -> tuple[str, tuple]:
+    # raises ValueError for anything the renderer would not accept, callers answer it with a 400
+    def number(key, default, low, high):
+        value = int(args.get(key, default))
+        if not low <= value <= high:
+            raise ValueError(f"{key} must be between {low} and {high}")
+        return value
+
+    def color(key, default):
+        value = args.get(key, default) or default
+        if value != "transparent":
+            ImageColor.getrgb(value)
+        return value
+
+    options = (
+        number("version", 0, 0, 40),
+        number("box_size", 20, 1, 100),
+        number("border", 0, 0, 100),
+        color("fill", "black"),
+        color("back", "white"),
+    )
+    return args.get("text", ""), options
+
+
+def render_payloads(template: str, rows: list[dict]) -> tuple[list[str], int]:
+    try:
+        template = mako_template.Template(template)
+    except mako_exceptions.MakoException as e:
+        raise ValueError(f"Invalid template: {e}")
+
+    payloads = []
+    failed = 0
+    for row in rows:
+        # a row the template cannot render is left empty and skipped, the others still get their code
+        try:
+            payloads.append(template.render(**(row | {k.lower(): v for k, v in row.items()})).strip())
+        except Exception:
+            payloads.append("")
+            failed += 1
+    return payloads, failed
+
+
+def bulk_qr_png(payloads: list[str], options: tuple = (), max_workers: int | None = None) -> dict[str, bytes]:
+    unique = [payload for payload in dict.fromkeys(payloads) if payload]
+    if len(unique) < POOL_THRESHOLD or (max_workers or os.cpu_count() or 1) == 1:
+        return {payload: qr_png(payload, options) for payload in unique}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        images = executor.map(qr_png, unique, [options] * len(unique), chunksize=32)
+        return dict(zip(unique, images))
+
+
+def qr_zip(names: list[str], payloads: list[str], images: dict[str, bytes]) -> bytes:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for name, payload in zip(names, payloads):
+            if payload:
+                zf.writestr(f"{name}.png", images[payload])
+    return buffer.getvalue()
+
+
+def qr_sheet(labels: list[str], payloads: list[str], images: dict[str, bytes], font_path: str = "./Roboto.ttf") -> bytes:
+    font = ImageFont.truetype(font_path, SHEET_LABEL_SIZE)
+    cell_w = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+    cell_h = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // SHEET_ROWS
+    size = min(cell_w, cell_h - SHEET_LABEL_SIZE * 2) - 20
+
+    pages = []
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    items = [(label, payload) for label, payload in zip(labels, payloads) if payload]
+    for start in range(0, len(items), per_page):
+        page = Image.new("RGB", SHEET_SIZE, "white")
+        d = ImageDraw.Draw(page)
+        for i, (label, payload) in enumerate(items[start:start + per_page]):
+            x = SHEET_MARGIN + (i % SHEET_COLUMNS) * cell_w
+            y = SHEET_MARGIN + (i // SHEET_COLUMNS) * cell_h
+            with Image.open(BytesIO(images[payload])) as img:
+                img = img.convert("RGBA").resize((size, size), Image.NEAREST)
+                page.paste(img, (x + (cell_w - size) // 2, y), img)
+            d.text((x + cell_w // 2, y + size + 8), label, fill="black", font=font, anchor="ma")
+        pages.append(page)
+
+    buffer = BytesIO()
+    if pages:
+        pages[0].save(buffer, format="PDF", save_all=True, append_images=pages[1:], resolution=SHEET_DPI)
+    return buffer.getvalue()
+
+
+def unique_names(names: list[str]) -> list[str]:
+    # names have to stay unique inside the archive
+    counts = Counter(names)
+    return [f"{name or 'qr'}_{i + 1}" if counts[name] > 1 or not name else name for i, name in enumerate(names)]
@@ -0,0 +1,203 @@
+import io
+import os
+import re
+import sqlite3
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+
+from utils import fold_text
+
+RATING_LIST_FOLDER = "./rating_list"
+RATING_LIST_INDEX = os.path.join(RATING_LIST_FOLDER, "rating_list.sqlite")
+
+# sqlite default limit for host parameters is 999 on older builds
+CHUNK_SIZE = 900
+# players read between two progress reports while indexing
+PROGRESS_EVERY = 20000
+
+TXT_COLUMNS = {
+    "ID Number": "fideid",
+    "Name": "name",
+    "Fed": "federation",
+    "Sex": "sex",
+    "Tit": "title",
+    "WTit": "w_title",
+    "SRtng": "rating",
+    "B-day": "birthday",
+}
+
+XML_TAGS = {
+    "fideid": "fideid",
+    "name": "name",
+    "country": "federation",
+    "sex": "sex",
+    "title": "title",
+    "w_title": "w_title",
+    "rating": "rating",
+    "birthday": "birthday",
+}
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(sorted(re.findall(r"[a-z0-9]+", fold_text(name))))
+
+
+def _open_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if zipfile.is_zipfile(source):
+        zf = zipfile.ZipFile(source)
+        member = next(n for n in zf.namelist() if n.lower().endswith((".xml", ".txt")))
+        return zf.open(member), member.lower().endswith(".xml")
+    if hasattr(source, "seek"):
+        source.seek(0)
+        head = source.read(64)
+        source.seek(0)
+        return source, head.lstrip().startswith(b"<")
+    return open(source, "rb"), str(source).lower().endswith(".xml")
+
+
+def _read_txt(f):
+    lines = io.TextIOWrapper(f, encoding="utf-8", errors="replace")
+    header = next(lines)
+    starts = [(m.start(), m.group()) for m in re.finditer(r"ID Number|\S+", header)]
+    if not starts or starts[0][1] != "ID Number":
+        raise ValueError("Unrecognized rating list header")
+
+    # the standard-only list names its rating column after the period, e.g. "Feb25"
+    rating_label = "SRtng" if any(label == "SRtng" for _, label in starts) else starts[[label for _, label in starts].index("FOA") + 1][1]
+    spans = []
+    for i, (start, label) in enumerate(starts):
+        key = "rating" if label == rating_label else TXT_COLUMNS.get(label)
+        if key:
+            end = starts[i + 1][0] if i + 1 < len(starts) else None
+            spans.append((key, start, end))
+
+    for line in lines:
+        if line.strip():
+            yield {key: line[start:end].strip() for key, start, end in spans}
+
+
+def _read_xml(f):
+    for _, elem in ET.iterparse(f, events=("end",)):
+        if elem.tag != "player":
+            continue
+        yield {XML_TAGS[child.tag]: (child.text or "").strip() for child in elem if child.tag in XML_TAGS}
+        elem.clear()
+
+
+def read_rating_list(source):
+    f, is_xml = _open_source(source)
+    with f:
+        yield from (_read_xml(f) if is_xml else _read_txt(f))
+
+
+def build_index(source, path: str = RATING_LIST_INDEX, progress=None) -> int:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    con = sqlite3.connect(tmp_path)
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    con.execute(
+        "CREATE TABLE players ("
+        "fideid INTEGER PRIMARY KEY, name TEXT, name_key TEXT, federation TEXT,"
+        "sex TEXT, title TEXT, rating INTEGER, birthday TEXT)"
+    )
+
+    def rows():
+        for i, p in enumerate(read_rating_list(source)):
+            if progress and i and i % PROGRESS_EVERY == 0:
+                progress(i)
+            if not p.get("fideid", "").isdigit():
+                continue
+            rating = p.get("rating", "")
+            yield (
+                int(p["fideid"]), p.get("name", ""), normalize_name(p.get("name", "")), p.get("federation", ""),
+                p.get("sex", ""), p.get("title") or p.get("w_title", ""), int(rating) if rating.isdigit() else None,
+                p.get("birthday", ""),
+            )
+
+    with con:
+        con.executemany("INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows())
+        con.execute("CREATE INDEX players_name_key ON players (name_key, federation)")
+    count = con.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+    con.close()
+
+    os.replace(tmp_path, path)
+    return count
+
+
+def index_exists(path: str = RATING_LIST_INDEX) -> bool:
+    return os.path.exists(path)
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+
+def _fetch(con, column, values):
+    result = {}
+    for chunk in _chunks(values):
+        rows = con.execute(
+            f"SELECT fideid, name, name_key, federation, sex, title, rating FROM players WHERE {column} IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for row in rows:
+            player = dict(zip(("fideid", "name", "name_key", "federation", "sex", "title", "rating"), row))
+            result.setdefault(player[column], []).append(player)
+    return result
+
+
+def lookup(data: list[dict], path: str = RATING_LIST_INDEX) -> list[dict | None]:
+    ids = {int(str(row.get("FIDEId")).strip()) for row in data if str(row.get("FIDEId", "")).strip().isdigit()}
+    keys = {normalize_name(row["Name"]) for row in data if row.get("Name")}
+
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        by_id = _fetch(con, "fideid", ids)
+        by_name = _fetch(con, "name_key", keys - {""})
+    finally:
+        con.close()
+
+    result = []
+    for row in data:
+        fide_id = str(row.get("FIDEId", "")).strip()
+        if fide_id.isdigit() and int(fide_id) in by_id:
+            result.append(by_id[int(fide_id)][0])
+            continue
+
+        candidates = by_name.get(normalize_name(row.get("Name", "")), [])
+        federation = str(row.get("Federation", "")).strip().upper()
+        if len(candidates) > 1 and federation:
+            candidates = [p for p in candidates if p["federation"] == federation]
+        result.append(candidates[0] if len(candidates) == 1 else None)
+    return result
+
+
+def auto_fill(data: list[dict], path: str = RATING_LIST_INDEX) -> tuple[list[dict], int]:
+    filled = 0
+    for row, player in zip(data, lookup(data, path)):
+        if not player:
+            continue
+        row["FIDEId"] = player["fideid"]
+        if player["rating"]:
+            row["Rating"] = player["rating"]
+        if player["title"]:
+            row["Title"] = player["title"]
+        if not row.get("Federation"):
+            row["Federation"] = player["federation"]
+        filled += 1
+    return data, filled
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python -m core.rating_list <rating list .xml/.txt/.zip> [index path]")
+        sys.exit(1)
+    print(f"Indexed {build_index(sys.argv[1], *sys.argv[2:3])} players")
@@ -0,0 +1,169 @@
+import io
+import re
+from html.parser import HTMLParser
+
+from core.tie_breaks import fill_tie_breaks
+from utils import fold_text, lazy_import
+
+openpyxl = lazy_import("openpyxl")
+
+SUMMARY_FIELDS = ["rank", "no", "name", "team", "score", "tb1", "tb2", "tb3", "tb4", "tb5"]
+
+# lower cased, accent folded header labels used by Swiss-Manager in its different languages
+HEADER_ALIASES = {
+    "rank": {"rk", "rk.", "rank", "rg", "rg.", "pl", "pl.", "place", "hang", "#"},
+    "no": {"sno", "snr", "no", "no.", "nr", "nr.", "start no", "stt"},
+    "name": {"name", "ten", "ho ten", "ho va ten", "player"},
+    "team": {"club/city", "club", "team", "verein/ort", "verein", "club/ville", "don vi", "doi"},
+    "federation": {"fed", "fed.", "land", "federation"},
+    "score": {"pts", "pts.", "points", "pkt", "pkt.", "score", "diem"},
+}
+
+TRF_ROUND_START = 91
+TRF_ROUND_WIDTH = 10
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value).strip()
+
+
+def map_header(header: list) -> dict[str, int] | None:
+    labels = [fold_text(v) for v in header]
+    columns = {}
+    for field, aliases in HEADER_ALIASES.items():
+        index = next((i for i, label in enumerate(labels) if label in aliases), None)
+        if index is not None:
+            columns[field] = index
+    if "name" not in columns or "score" not in columns:
+        return None
+
+    tie_breaks = [i for i, label in enumerate(labels) if re.fullmatch(r"(tb|wtg|tie ?break) ?\d", label)]
+    if not tie_breaks:
+        # tie-break columns follow the points column in Swiss-Manager rankings
+        tie_breaks = [i for i in range(columns["score"] + 1, len(labels)) if labels[i]]
+    for i, index in enumerate(tie_breaks[:5]):
+        columns[f"tb{i + 1}"] = index
+    if "team" not in columns and "federation" in columns:
+        columns["team"] = columns["federation"]
+    return columns
+
+
+def read_table_rows(rows) -> list[dict]:
+    columns = None
+    result = []
+    for row in rows:
+        row = list(row)
+        if columns is None:
+            columns = map_header(row)
+            continue
+        values = {field: _cell(row[index]) if index < len(row) else "" for field, index in columns.items()}
+        if not values.get("name"):
+            # a blank line or a new header ends the section
+            if result:
+                break
+            continue
+        result.append({field: values.get(field, "") for field in SUMMARY_FIELDS})
+    return result
+
+
+def read_xlsx(content: bytes, sheet: str | None = None) -> list[dict]:
+    wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        return read_table_rows(ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+class _TableRowParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._row is not None and self._cell is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def iter_html_rows(content: bytes, chunk_size: int = 1 << 16):
+    parser = _TableRowParser()
+    text = content.decode("utf-8", errors="replace")
+    for i in range(0, len(text), chunk_size):
+        parser.feed(text[i:i + chunk_size])
+        yield from parser.rows
+        parser.rows = []
+    parser.close()
+    yield from parser.rows
+
+
+def read_html(content: bytes) -> list[dict]:
+    return read_table_rows(iter_html_rows(content))
+
+
+def read_trf_players(lines):
+    teams = {}
+    players = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.startswith("001"):
+            rounds = []
+            for start in range(TRF_ROUND_START, len(line), TRF_ROUND_WIDTH):
+                opponent, color, result = line[start:start + 4].strip(), line[start + 5:start + 6], line[start + 7:start + 8]
+                rounds.append((int(opponent) if opponent.isdigit() else 0, color.strip(), result.strip()))
+            players.append({
+                "no": line[4:8].strip(),
+                "sex": line[9:10].strip(),
+                "title": line[10:13].strip(),
+                "name": line[14:47].strip(),
+                "rating": line[48:52].strip(),
+                "federation": line[53:56].strip(),
+                "fideid": line[57:68].strip(),
+                "score": line[80:84].strip(),
+                "rank": line[85:89].strip(),
+                "rounds": rounds,
+            })
+        elif line.startswith("013"):
+            for no in line[36:].split():
+                teams[no] = line[4:36].strip()
+    for player in players:
+        player["team"] = teams.get(player["no"], player["federation"])
+    return players
+
+
+def read_trf(content: bytes, tie_breaks: list[str] | None = None) -> list[dict]:
+    lines = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8", errors="replace")
+    # TRF files carry the round results but no tie-break values
+    players = fill_tie_breaks(read_trf_players(lines), tie_breaks)
+    players.sort(key=lambda p: int(p["rank"]) if p["rank"].isdigit() else len(players) + 1)
+    return [{field: player.get(field, "") for field in SUMMARY_FIELDS} for player in players]
+
+
+def read_standings(content: bytes, filename: str, tie_breaks: list[str] | None = None) -> list[dict]:
+    filename = filename.lower()
+    if filename.endswith((".xlsx", ".xlsm")):
+        return read_xlsx(content)
+    if filename.endswith((".html", ".htm")):
+        return read_html(content)
+    if filename.endswith((".trf", ".txt")) or content.lstrip().startswith(b"012") or b"\n001 " in content:
+        return read_trf(content, tie_breaks)
+    raise ValueError(f"Unsupported standings file: {filename}")
@@ -0,0 +1,410 @@
+import hashlib
+import heapq
+import json
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Literal
+
+from core.standings import SUMMARY_FIELDS, read_standings
+from utils import parse_number, parse_numbers, column_widths, set_column_widths, lazy_import
+
+pandas = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+
+NUMERIC_FIELDS = ["rank", "score", "tb1", "tb2", "tb3", "tb4", "tb5"]
+
+
+def generate_summary(data, sort_by: Literal["rank", "score"] = "rank", top=3):
+    df = pandas.DataFrame(data)
+    for col in ["rank", "no", "name", "team"]:
+        if col not in df:
+            df[col] = ""
+    df = df[df[["rank", "no", "name", "team"]].fillna("").astype(bool).any(axis=1)]
+    if df.empty:
+        return {}
+
+    df = df.dropna(axis=1, how="all").copy()
+    for col in NUMERIC_FIELDS + ["team"]:
+        if col not in df:
+            df[col] = ""
+
+    # a blank rank means a shared place with the row above
+    df["rank"] = df["rank"].mask(df["rank"] == "").ffill().fillna(1)
+    df["team"] = df["team"].fillna("")
+    df[NUMERIC_FIELDS] = df[NUMERIC_FIELDS].apply(parse_numbers)
+
+    if sort_by == "rank":
+        df_top = df.sort_values("rank", kind="stable")
+    else:
+        df_top = df.sort_values(["score", "rank"], ascending=[False, True], kind="stable")
+    df_top = df_top.groupby("team", sort=False, dropna=False).head(int(top) if top else len(df))
+
+    totals = df_top.groupby("team", sort=False, dropna=False)[NUMERIC_FIELDS].sum().to_dict(orient="index")
+
+    result = {team: {"players": [], **totals[team]} for team in df["team"].unique()}
+    for player in df_top.to_dict(orient="records"):
+        result[player["team"]]["players"].append(player)
+
+    return result
+
+
+def rank_summary(summary_data: dict, sort_by: Literal["rank", "score"] = "rank") -> "pandas.DataFrame":
+    ranked = pandas.DataFrame(
+        [{"team": team, **values, "count": len(values["players"])} for team, values in summary_data.items()],
+        columns=["team", "players", "count"] + NUMERIC_FIELDS,
+    )
+
+    # more counted players first, then lower total rank / higher total score, then higher tie-breaks
+    order = ["count", "rank", "score"] if sort_by == "rank" else ["count", "score", "rank"]
+    ranked = ranked.sort_values(
+        order + ["tb1", "tb2", "tb3", "tb4", "tb5"],
+        ascending=[False, sort_by == "rank", sort_by != "rank", False, False, False, False, False],
+        kind="stable",
+    ).reset_index(drop=True)
+    ranked.insert(0, "place", ranked.index + 1)
+    return ranked
+
+
+RANKED_TEAMS_CACHE = OrderedDict()
+RANKED_TEAMS_CACHE_SIZE = 32
+
+
+def rank_teams(data, sort_by: Literal["rank", "score"] = "rank", top=3) -> "pandas.DataFrame":
+    key = (hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest(), sort_by, top)
+    if key in RANKED_TEAMS_CACHE:
+        RANKED_TEAMS_CACHE.move_to_end(key)
+        return RANKED_TEAMS_CACHE[key]
+
+    ranked = rank_summary(generate_summary(data, sort_by=sort_by, top=top), sort_by)
+
+    RANKED_TEAMS_CACHE[key] = ranked
+    if len(RANKED_TEAMS_CACHE) > RANKED_TEAMS_CACHE_SIZE:
+        RANKED_TEAMS_CACHE.popitem(last=False)
+    return ranked
+
+
+class IncrementalSummary:
+    """Team summary that only recomputes the teams touched by changed rows."""
+
+    # past this share of changed rows a full rebuild is cheaper than patching
+    REBUILD_RATIO = 0.25
+
+    def __init__(self, sort_by: Literal["rank", "score"] = "rank", top=3):
+        # held for a whole update, concurrent callbacks of one client must not interleave their patches
+        self.lock = threading.Lock()
+        self.sort_by = sort_by
+        self.top = int(top) if top else None
+        self.rows = []
+        self.players = []
+        self.teams = {}
+        self.summary = {}
+        self.ranked = None
+
+    def _player(self, i):
+        row = self.rows[i]
+        if not (row.get("rank") or row.get("no") or row.get("name") or row.get("team")):
+            return None
+
+        player = dict(row)
+        for k in NUMERIC_FIELDS:
+            player[k] = parse_number(row.get(k) if row.get(k) is not None else "")
+        player["team"] = row.get("team") or ""
+        if row.get("rank") in ("", None):
+            # a blank rank means a shared place with the row above
+            player["rank"] = next((self.players[k]["rank"] for k in range(i - 1, -1, -1) if self.players[k]), 1)
+        return player
+
+    def _key(self, i):
+        player = self.players[i]
+        if self.sort_by == "rank":
+            return player["rank"], i
+        return -player["score"], player["rank"], i
+
+    def _update_team(self, team):
+        indices = self.teams.get(team)
+        if not indices:
+            self.summary.pop(team, None)
+            return
+
+        top = heapq.nsmallest(self.top or len(indices), indices, key=self._key)
+        players = [self.players[i] for i in top]
+        self.summary[team] = {
+            "players": players,
+            **{k: sum(p[k] for p in players) for k in NUMERIC_FIELDS},
+            "first": min(indices),
+        }
+
+    def _set_player(self, i, dirty):
+        old, new = self.players[i], self._player(i)
+        if old:
+            self.teams[old["team"]].discard(i)
+            dirty.add(old["team"])
+        if new:
+            self.teams.setdefault(new["team"], set()).add(i)
+            dirty.add(new["team"])
+        self.players[i] = new
+
+    def _rerank(self):
+        summary = sorted(self.summary.items(), key=lambda x: x[1]["first"])
+        self.ranked = rank_summary({team: {k: v for k, v in values.items() if k != "first"} for team, values in summary}, self.sort_by)
+        return self.ranked
+
+    def rebuild(self, data):
+        self.rows = [dict(row) for row in data]
+        self.players = [None] * len(self.rows)
+        self.teams = {}
+        self.summary = {}
+        dirty = set()
+        for i in range(len(self.rows)):
+            self._set_player(i, dirty)
+        for team in dirty:
+            self._update_team(team)
+        return self._rerank()
+
+    def update(self, data):
+        if self.ranked is None or len(data) != len(self.rows):
+            return self.rebuild(data)
+
+        changed = [i for i, (old, new) in enumerate(zip(self.rows, data)) if old != new]
+        if not changed:
+            return self.ranked
+        if len(changed) > len(data) * self.REBUILD_RATIO:
+            return self.rebuild(data)
+
+        dirty = set()
+        for i in changed:
+            self.rows[i] = dict(data[i])
+            self._set_player(i, dirty)
+            # rows sharing the place of the edited row follow its rank
+            j = i + 1
+            while j < len(self.rows) and self.rows[j].get("rank") in ("", None):
+                if self.players[j]:
+                    self._set_player(j, dirty)
+                j += 1
+        for team in dirty:
+            self._update_team(team)
+        return self._rerank()
+
+
+SUMMARY_STATES = OrderedDict()
+SUMMARY_STATES_SIZE = 64
+_states_lock = threading.Lock()
+
+
+def _reset_locks():
+    # background jobs are forked from a worker, a lock held by one of its other threads would never be released
+    global _states_lock
+    _states_lock = threading.Lock()
+    for state in SUMMARY_STATES.values():
+        state.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_locks)
+
+
+def incremental_rank_teams(client_id, data, sort_by: Literal["rank", "score"] = "rank", top=3) -> "pandas.DataFrame":
+    key = (client_id, sort_by, top)
+    with _states_lock:
+        if key not in SUMMARY_STATES:
+            SUMMARY_STATES[key] = IncrementalSummary(sort_by=sort_by, top=top)
+            if len(SUMMARY_STATES) > SUMMARY_STATES_SIZE:
+                SUMMARY_STATES.popitem(last=False)
+        SUMMARY_STATES.move_to_end(key)
+        state = SUMMARY_STATES[key]
+    with state.lock:
+        return state.update(data)
+
+
+def chart_data(ranked: "pandas.DataFrame", chart_top: int | None = None, series=NUMERIC_FIELDS) -> tuple[list, dict[str, list]]:
+    if not chart_top or len(ranked) <= chart_top:
+        return ranked["team"].tolist(), {k: ranked[k].tolist() for k in series}
+
+    # everything past the shown teams is folded into one averaged bar
+    shown, others = ranked.iloc[:int(chart_top)], ranked.iloc[int(chart_top):]
+    teams = shown["team"].tolist() + [f"Others ({len(others)} teams, avg)"]
+    return teams, {k: shown[k].tolist() + [round(others[k].mean(), 2)] for k in series}
+
+
+def format_cell(value):
+    if isinstance(value, float):
+        return f'{value:g}'
+    return "" if value is None else str(value)
+
+
+def write_summary_sheet(ws, ranked, sort_by):
+    header = ["Rank", "Team", "Total Rank", "Score", "TB1", "TB2", "TB3", "TB4", "TB5"] if sort_by == "rank" else ["Rank", "Team", "Score", "Total Rank", "TB1", "TB2", "TB3", "TB4", "TB5"]
+    order = ["rank", "score"] if sort_by == "rank" else ["score", "rank"]
+    fields = order + ["tb1", "tb2", "tb3", "tb4", "tb5"]
+
+    rows = [(False, header)]
+    for values in ranked.to_dict(orient="records"):
+        rows.append((True, [format_cell(v) for v in [values["place"], values["team"], *(values[k] for k in fields)]]))
+        for j, player in enumerate(values["players"]):
+            rows.append((False, [format_cell(v) for v in [j + 1, player["name"], *(player[k] for k in fields)]]))
+
+    # write only sheets need their widths before the first row
+    set_column_widths(ws, column_widths(row for _, row in rows))
+    font = openpyxl.styles.Font(bold=True)
+    fill = openpyxl.styles.PatternFill(start_color="BFBFBF", end_color="BFBFBF", fill_type="solid")
+    for styled, row in rows:
+        if styled:
+            row = [openpyxl.cell.WriteOnlyCell(ws, value=v) for v in row]
+            for c in row:
+                c.font = font
+                c.fill = fill
+        ws.append(row)
+
+
+def write_players_sheet(ws, data, ranked):
+    counted = {(team, player.get("no"), player.get("name")) for team, players in zip(ranked["team"], ranked["players"]) for player in players}
+    places = dict(zip(ranked["team"], ranked["place"]))
+    players = sorted(
+        (row for row in data if row.get("name")),
+        key=lambda row: places.get(row.get("team") or "", len(places) + 1),
+    )
+
+    header = ["Team rank", "Team", "Counted", *(v for v in SUMMARY_FIELDS)]
+    rows = [
+        [format_cell(places.get(row.get("team") or "", "")), row.get("team") or "", "x" if (row.get("team") or "", row.get("no"), row.get("name")) in counted else "", *(format_cell(row.get(k)) for k in SUMMARY_FIELDS)]
+        for row in players
+    ]
+    set_column_widths(ws, column_widths(rows, column_widths([header])))
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+
+
+def write_standings_sheet(ws, data):
+    set_column_widths(ws, [max(len(k), 8) for k in SUMMARY_FIELDS])
+    ws.append(SUMMARY_FIELDS)
+    for row in data:
+        if row.get("rank") or row.get("no") or row.get("name") or row.get("team"):
+            ws.append([format_cell(row.get(k)) for k in SUMMARY_FIELDS])
+
+
+def write_settings_sheet(ws, data, ranked, sort_by, top):
+    rows = [
+        ["Rank by", sort_by],
+        ["Top", format_cell(top)],
+        ["Teams", format_cell(len(ranked))],
+        ["Players", format_cell(sum(1 for row in data if row.get("name")))],
+        ["Exported at", f"{datetime.now():%Y-%m-%d %H:%M:%S}"],
+    ]
+    set_column_widths(ws, column_widths(rows))
+    for row in rows:
+        ws.append(row)
+
+
+def export_summary(data, sort_by: Literal["rank", "score"] = "rank", top: int = 3, sheets=(), ranked=None):
+    if ranked is None:
+        ranked = rank_teams(data, sort_by=sort_by, top=top)
+
+    wb = openpyxl.Workbook(write_only=True)
+    write_summary_sheet(wb.create_sheet("Summary"), ranked, sort_by)
+    if "players" in sheets:
+        write_players_sheet(wb.create_sheet("Players"), data, ranked)
+    if "standings" in sheets:
+        write_standings_sheet(wb.create_sheet("Standings"), data)
+    if "settings" in sheets:
+        write_settings_sheet(wb.create_sheet("Settings"), data, ranked, sort_by, top)
+
+    f = tempfile.TemporaryFile()
+    wb.save(f)
+    f.seek(0)
+    return f
+
+
+def unique_section_name(sections: dict, name: str) -> str:
+    # files from different folders or formats may share a name
+    key, i = name, 2
+    while key in sections:
+        key, i = f"{name} ({i})", i + 1
+    return key
+
+
+def read_section(content: bytes, filename: str, tie_breaks: list[str] | None = None) -> list[dict]:
+    # errors raised in the pool do not say which file they came from
+    try:
+        return read_standings(content, filename, tie_breaks)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise ValueError(f"{filename}: {e}") from e
+
+
+def read_sections(files: list[tuple[str, bytes]], max_workers: int | None = None, tie_breaks: list[str] | None = None) -> dict[str, list[dict]]:
+    names = [os.path.splitext(os.path.basename(filename))[0] for filename, _ in files]
+    if len(files) == 1:
+        sections = [read_section(files[0][1], files[0][0], tie_breaks)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(files), max_workers or os.cpu_count() or 1)) as executor:
+            sections = list(executor.map(read_section,[content for _, content in files], [filename for filename, _ in files], [tie_breaks] * len(files)))
+
+    result = {}
+    for name, rows in zip(names, sections):
+        result[unique_section_name(result, name)] = rows
+    return result
+
+
+def aggregate_sections(sections: dict[str, list[dict]], sort_by: Literal["rank", "score"] = "rank", top=3, best: int | None = None):
+    ranked = {name: rank_teams(rows, sort_by=sort_by, top=top) for name, rows in sections.items()}
+
+    results = pandas.concat(
+        [df.assign(section=name)[["section", "place", "team", "score"]] for name, df in ranked.items()],
+        ignore_index=True,
+    ) if ranked else pandas.DataFrame(columns=["section", "place", "team", "score"])
+    results["gold"] = results["place"] == 1
+    results["silver"] = results["place"] == 2
+    results["bronze"] = results["place"] == 3
+
+    # sum of each team's best N section scores, all sections when N is not given
+    results = results.sort_values(["team", "score"], ascending=[True, False], kind="stable")
+    counted = results.groupby("team", sort=False).head(int(best)) if best else results
+    overall = results.groupby("team").agg(
+        sections=("section", "count"), gold=("gold", "sum"), silver=("silver", "sum"), bronze=("bronze", "sum"),
+    ).join(counted.groupby("team")["score"].sum()).reset_index()
+
+    overall = overall.sort_values(["gold", "silver", "bronze", "score"], ascending=False, kind="stable").reset_index(drop=True)
+    overall.insert(0, "place", overall.index + 1)
+    return ranked, overall
+
+
+def write_overall_sheet(ws, overall):
+    header = ["Rank", "Team", "Gold", "Silver", "Bronze", "Score", "Sections"]
+    rows = [[format_cell(v) for v in row] for row in overall[["place", "team", "gold", "silver", "bronze", "score", "sections"]].itertuples(index=False)]
+    set_column_widths(ws, column_widths(rows, column_widths([header])))
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+
+
+def sheet_title(name: str, used: set) -> str:
+    title = re.sub(r"[\[\]:*?/\\]", "_", name)[:31] or "Section"
+    base, i = title, 2
+    while title.lower() in used:
+        suffix = f" ({i})"
+        title, i = base[:31 - len(suffix)] + suffix, i + 1
+    used.add(title.lower())
+    return title
+
+
+def export_sections(sections: dict[str, list[dict]], sort_by: Literal["rank", "score"] = "rank", top: int = 3, best: int | None = None):
+    ranked, overall = aggregate_sections(sections, sort_by=sort_by, top=top, best=best)
+    return write_sections(ranked, overall, sort_by)
+
+
+def write_sections(ranked: dict[str, "pandas.DataFrame"], overall: "pandas.DataFrame", sort_by: Literal["rank", "score"] = "rank"):
+    wb = openpyxl.Workbook(write_only=True)
+    used = {"overall"}
+    write_overall_sheet(wb.create_sheet("Overall"), overall)
+    for name, df in ranked.items():
+        write_summary_sheet(wb.create_sheet(sheet_title(name, used)), df, sort_by)
+
+    f = tempfile.TemporaryFile()
+    wb.save(f)
+    f.seek(0)
+    return f
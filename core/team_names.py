@@ -0,0 +1,79 @@
+import re
+from collections import Counter
+
+from utils import fold_text
+
+FUZZY_THRESHOLD = 0.6
+
+
+def team_key(name) -> str:
+    return " ".join(re.findall(r"\w+", fold_text(name)))
+
+
+def trigrams(key: str) -> set[str]:
+    key = f"  {key} "
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+class TeamNameResolver:
+    def __init__(self, mapping: dict[str, str], fuzzy: bool = False, threshold: float = FUZZY_THRESHOLD):
+        self.fuzzy = fuzzy
+        self.threshold = threshold
+        self.index = {}
+        self.targets = set()
+        for source, target in mapping.items():
+            self.index.setdefault(team_key(source), target)
+            self.targets.add(team_key(target))
+
+        self.trigrams = {}
+        self.keys = list(self.index)
+        self.sizes = []
+        if fuzzy:
+            for i, key in enumerate(self.keys):
+                grams = trigrams(key)
+                self.sizes.append(len(grams))
+                for gram in grams:
+                    self.trigrams.setdefault(gram, []).append(i)
+
+    def _fuzzy(self, key: str) -> str | None:
+        grams = trigrams(key)
+        shared = Counter(i for gram in grams for i in self.trigrams.get(gram, ()))
+        best, best_score, tie = None, 0.0, False
+        for i, count in shared.items():
+            # Dice coefficient over the trigram sets
+            score = 2 * count / (len(grams) + self.sizes[i])
+            if score > best_score:
+                best, best_score, tie = i, score, False
+            elif score == best_score:
+                tie = True
+        if best is None or tie or best_score < self.threshold:
+            return None
+        return self.index[self.keys[best]]
+
+    def resolve(self, name) -> str | None:
+        key = team_key(name)
+        if key in self.index:
+            return self.index[key]
+        if self.fuzzy and key and key not in self.targets:
+            return self._fuzzy(key)
+        return None
+
+    def resolve_all(self, names) -> tuple[dict, list]:
+        resolved, unresolved = {}, []
+        for name in dict.fromkeys(names):
+            if not name:
+                continue
+            target = self.resolve(name)
+            if target is not None:
+                resolved[name] = target
+            elif team_key(name) not in self.targets:
+                unresolved.append(name)
+        return resolved, unresolved
+
+
+def replace_team_names(data: list[dict], mapping: dict[str, str], fuzzy: bool = False) -> tuple[list[dict], list]:
+    resolved, unresolved = TeamNameResolver(mapping, fuzzy=fuzzy).resolve_all(row.get("team") for row in data)
+    for row in data:
+        if row.get("team") in resolved:
+            row["team"] = resolved[row["team"]]
+    return data, unresolved
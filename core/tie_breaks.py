@@ -0,0 +1,87 @@
+from utils import lazy_import
+
+numpy = lazy_import("numpy")
+
+# TRF-16 result codes, byes and forfeits included
+RESULT_POINTS = {
+    "1": 1.0, "=": 0.5, "0": 0.0,
+    "W": 1.0, "D": 0.5, "L": 0.0,
+    "+": 1.0, "-": 0.0,
+    "H": 0.5, "F": 1.0, "U": 1.0, "Z": 0.0,
+}
+WIN_RESULTS = {"1", "W", "+"}
+
+TIE_BREAKS = {
+    "buchholz": "Buchholz",
+    "buchholz_cut1": "Buchholz Cut-1",
+    "sonneborn_berger": "Sonneborn-Berger",
+    "progressive": "Progressive",
+    "direct_encounter": "Direct encounter",
+    "wins": "Number of wins",
+}
+DEFAULT_TIE_BREAKS = ["buchholz_cut1", "buchholz", "sonneborn_berger", "direct_encounter", "wins"]
+
+
+def game_arrays(players: list[dict]):
+    index = {player["no"]: i for i, player in enumerate(players)}
+    rounds = max((len(player["rounds"]) for player in players), default=0)
+
+    player_idx, opponent_idx, round_idx, points, wins = [], [], [], [], []
+    for i, player in enumerate(players):
+        for r, (opponent, color, result) in enumerate(player["rounds"]):
+            if result not in RESULT_POINTS:
+                continue
+            player_idx.append(i)
+            opponent_idx.append(index.get(str(opponent), -1) if opponent else -1)
+            round_idx.append(r)
+            points.append(RESULT_POINTS[result])
+            wins.append(result in WIN_RESULTS)
+
+    return (
+        len(players), rounds,
+        numpy.array(player_idx, dtype=numpy.intp), numpy.array(opponent_idx, dtype=numpy.intp),
+        numpy.array(round_idx, dtype=numpy.intp), numpy.array(points, dtype=float), numpy.array(wins, dtype=bool),
+    )
+
+
+def compute_tie_breaks(players: list[dict], names: list[str] = None) -> "dict[str, numpy.ndarray]":
+    n, rounds, player_idx, opponent_idx, round_idx, points, wins = game_arrays(players)
+    names = names or DEFAULT_TIE_BREAKS
+
+    score = numpy.bincount(player_idx, points, minlength=n)
+    played = opponent_idx >= 0
+    p, o = player_idx[played], opponent_idx[played]
+    opponent_score = score[o]
+
+    result = {"score": score}
+    if "buchholz" in names or "buchholz_cut1" in names:
+        buchholz = numpy.bincount(p, opponent_score, minlength=n)
+        result["buchholz"] = buchholz
+        if "buchholz_cut1" in names:
+            lowest = numpy.full(n, numpy.inf)
+            numpy.minimum.at(lowest, p, opponent_score)
+            result["buchholz_cut1"] = buchholz - numpy.where(numpy.isinf(lowest), 0, lowest)
+    if "sonneborn_berger" in names:
+        result["sonneborn_berger"] = numpy.bincount(p, points[played] * opponent_score, minlength=n)
+    if "progressive" in names:
+        table = numpy.zeros((n, max(rounds, 1)))
+        numpy.add.at(table, (player_idx, round_idx), points)
+        result["progressive"] = numpy.cumsum(table, axis=1).sum(axis=1)
+    if "direct_encounter" in names:
+        tied = score[p] == score[o]
+        result["direct_encounter"] = numpy.bincount(p[tied], points[played][tied], minlength=n)
+    if "wins" in names:
+        result["wins"] = numpy.bincount(player_idx, wins.astype(float), minlength=n)
+
+    return result
+
+
+def fill_tie_breaks(players: list[dict], names: list[str] = None) -> list[dict]:
+    names = [name for name in (names or DEFAULT_TIE_BREAKS) if name in TIE_BREAKS][:5]
+    result = compute_tie_breaks(players, names)
+    for i, player in enumerate(players):
+        if not player.get("score"):
+            player["score"] = f'{result["score"][i]:g}'
+        for j, name in enumerate(names):
+            player[f"tb{j + 1}"] = f"{result[name][i]:g}"
+    return players
@@ -0,0 +1,39 @@
+import re
+import subprocess
+import sys
+
+LINE_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(module: str = "app") -> tuple[int, dict[str, int]]:
+    # a fresh interpreter so nothing is already cached in sys.modules
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+
+    total = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if not match:
+            continue
+        self_time, cumulative, indent, name = int(match[1]), int(match[2]), len(match[3]), match[4]
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_time
+        if indent == 1:
+            total += cumulative
+    return total, packages
+
+
+def report(module: str = "app", limit: int = 20) -> str:
+    total, packages = import_times(module)
+    lines = [f"{'module':<32}{'ms':>10}{'%':>8}"]
+    for package, us in sorted(packages.items(), key=lambda x: x[1], reverse=True)[:limit]:
+        lines.append(f"{package:<32}{us / 1000:>10.1f}{us / total * 100 if total else 0:>8.1f}")
+    lines.append(f"{'total':<32}{total / 1000:>10.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    print(report(*sys.argv[1:2], *map(int, sys.argv[2:3])))
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import session_store
+from utils import TEMP_FOLDER, FONTS_FOLDER
+
+# 0 turns the janitor off, e.g. for tests
+JANITOR_INTERVAL = int(os.environ.get("JANITOR_INTERVAL", 600))
+# files used this recently are never evicted, they may still be written or about to be read
+IN_USE_GRACE = int(os.environ.get("JANITOR_IN_USE_GRACE", 300))
+
+# folder -> (max age in seconds, max total size in bytes)
+QUOTAS = {
+    TEMP_FOLDER: (
+        int(os.environ.get("TEMP_MAX_AGE", 7 * 24 * 3600)),
+        int(os.environ.get("TEMP_MAX_BYTES", 512 * 1024 ** 2)),
+    ),
+    FONTS_FOLDER: (
+        int(os.environ.get("FONTS_MAX_AGE", 30 * 24 * 3600)),
+        int(os.environ.get("FONTS_MAX_BYTES", 256 * 1024 ** 2)),
+    ),
+}
+
+_lock = threading.Lock()
+_thread = None
+_stats = {"runs": 0, "last_run": None, "folders": {}}
+
+
+@contextmanager
+def in_use(path: str):
+    # files are written from background jobs in other processes than the janitor thread, so use is
+    # marked on disk: the mtime is refreshed around the block and sweep spares it for IN_USE_GRACE
+    touch(path)
+    try:
+        yield path
+    finally:
+        touch(path)
+
+
+def touch(path: str):
+    # mark a file as recently used for the LRU eviction, reads do not update mtime
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def referenced_fonts() -> set[str]:
+    fonts = set()
+    for config in session_store.get_store().values("card_config"):
+        font = ((config or {}).get("config") or {}).get("font")
+        if font:
+            fonts.add(os.path.abspath(font))
+    return fonts
+
+
+def scan(folder: str) -> list[tuple[str, float, int]]:
+    entries = []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries.append((os.path.abspath(entry.path), max(stat.st_mtime, stat.st_atime), stat.st_size))
+    except FileNotFoundError:
+        pass
+    entries.sort(key=lambda x: x[1])
+    return entries
+
+
+def sweep(folder: str, max_age: float, max_bytes: int, keep: set[str] = frozenset(), now: float | None = None) -> dict:
+    now = time.time() if now is None else now
+    entries = scan(folder)
+
+    evicted_files = evicted_bytes = 0
+    remaining = []
+    for path, last_used, size in entries:
+        protected = path in keep or now - last_used < IN_USE_GRACE
+        if not protected and now - last_used > max_age and _remove(path):
+            evicted_files += 1
+            evicted_bytes += size
+        else:
+            remaining.append((path, last_used, size, protected))
+
+    # least recently used first until the folder fits its quota again
+    total = sum(size for _, _, size, _ in remaining)
+    for path, last_used, size, protected in remaining:
+        if total <= max_bytes:
+            break
+        if not protected and _remove(path):
+            evicted_files += 1
+            evicted_bytes += size
+            total -= size
+
+    return {
+        "files": len(entries) - evicted_files,
+        "bytes": sum(size for _, _, size in entries) - evicted_bytes,
+        "evicted_files": evicted_files,
+        "evicted_bytes": evicted_bytes,
+        "max_age": max_age,
+        "max_bytes": max_bytes,
+    }
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        # another worker got there first
+        return False
+    except OSError:
+        return False
+
+
+def run_once(quotas: dict = None) -> dict:
+    quotas = quotas or QUOTAS
+    fonts = referenced_fonts()
+    result = {}
+    for folder, (max_age, max_bytes) in quotas.items():
+        result[folder] = sweep(folder, max_age, max_bytes, keep=fonts if folder == FONTS_FOLDER else frozenset())
+    # sessions expire together with the temp files they refer to
+    pruned = session_store.get_store().prune(QUOTAS[TEMP_FOLDER][0])
+
+    with _lock:
+        _stats["runs"] += 1
+        _stats["last_run"] = time.time()
+        _stats["sessions_pruned"] = _stats.get("sessions_pruned", 0) + pruned
+        for folder, folder_stats in result.items():
+            totals = _stats["folders"].setdefault(folder, {"evicted_files_total": 0, "evicted_bytes_total": 0})
+            totals.update(folder_stats)
+            totals["evicted_files_total"] += folder_stats["evicted_files"]
+            totals["evicted_bytes_total"] += folder_stats["evicted_bytes"]
+    return result
+
+
+def stats() -> dict:
+    sessions = session_store.get_store().stats()
+    with _lock:
+        return {
+            "runs": _stats["runs"],
+            "last_run": _stats["last_run"],
+            "interval": JANITOR_INTERVAL,
+            "sessions_pruned": _stats.get("sessions_pruned", 0),
+            "sessions": sessions,
+            "folders": {folder: dict(values) for folder, values in _stats["folders"].items()},
+        }
+
+
+def _loop(interval: int):
+    while True:
+        try:
+            run_once()
+        except Exception as e:
+            print(f"Janitor run failed: {e}")
+        time.sleep(interval)
+
+
+def start(interval: int = JANITOR_INTERVAL) -> threading.Thread | None:
+    global _thread
+    if interval <= 0:
+        return None
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_loop, args=(interval,), name="temp-janitor", daemon=True)
+            _thread.start()
+        return _thread
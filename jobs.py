@@ -0,0 +1,34 @@
+import os
+import re
+import secrets
+
+from werkzeug.utils import secure_filename
+
+from utils import TEMP_FOLDER, ensure_folder
+
+JOB_PREFIX = "job_"
+JOB_URL = "/download"
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+# background callbacks report progress at most this many times per job
+PROGRESS_STEPS = 100
+
+
+def job_file(filename: str) -> tuple[str, str]:
+    # results live in the temp folder until the janitor evicts them
+    token = secrets.token_urlsafe(16)
+    filename = secure_filename(filename)
+    path = os.path.join(ensure_folder(TEMP_FOLDER), f"{JOB_PREFIX}{token}_{filename}")
+    return path, f"{JOB_URL}/{token}/{filename}"
+
+
+def job_result(token: str, filename: str) -> str | None:
+    filename = secure_filename(filename)
+    if not TOKEN_PATTERN.fullmatch(token) or not filename:
+        return None
+    path = os.path.join(TEMP_FOLDER, f"{JOB_PREFIX}{token}_{filename}")
+    return path if os.path.isfile(path) else None
+
+
+def progress_step(total: int) -> int:
+    return max(1, total // PROGRESS_STEPS)
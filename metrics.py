@@ -0,0 +1,170 @@
+import cProfile
+import heapq
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, jsonify, request
+
+CALLBACK_URL = "/_dash-update-component"
+# label for outputs the app does not know, request bodies must not be able to mint new series
+UNKNOWN_CALLBACK = "unknown"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# fraction of callback calls run under cProfile, 0 turns profiling off
+PROFILE_RATE = float(os.environ.get("CALLBACK_PROFILE_RATE", 0))
+PROFILE_KEEP = int(os.environ.get("CALLBACK_PROFILE_KEEP", 20))
+PROFILE_LINES = 30
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            result.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        result.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        result.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        result.append(f"{name}_count{{{labels}}} {self.count}")
+        return result
+
+
+HISTOGRAMS = {
+    "dash_callback_duration_seconds": ("Wall time spent in a callback request", DURATION_BUCKETS),
+    "dash_callback_cpu_seconds": ("CPU time of the thread serving a callback request", DURATION_BUCKETS),
+    "dash_callback_request_bytes": ("Size of the callback request payload", SIZE_BUCKETS),
+    "dash_callback_response_bytes": ("Size of the callback response payload", SIZE_BUCKETS),
+}
+COUNTERS = {
+    "dash_callback_prevented_total": "Callback calls that raised PreventUpdate",
+    "dash_callback_errors_total": "Callback calls that failed",
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_profiles = []
+_names = {}
+
+
+def callback_name(app, output) -> str:
+    if not isinstance(output, str) or output not in app.callback_map:
+        return UNKNOWN_CALLBACK
+    if output not in _names:
+        callback = app.callback_map[output].get("callback")
+        _names[output] = getattr(callback, "__name__", None) or UNKNOWN_CALLBACK
+    return _names[output]
+
+
+def label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def record(name: str, duration: float, cpu: float, request_bytes: int, response_bytes: int, status: int):
+    labels = f'callback="{label_value(name)}"'
+    with _lock:
+        for metric, value in (
+                ("dash_callback_duration_seconds", duration),
+                ("dash_callback_cpu_seconds", cpu),
+                ("dash_callback_request_bytes", request_bytes),
+                ("dash_callback_response_bytes", response_bytes),
+        ):
+            if (metric, labels) not in _histograms:
+                _histograms[metric, labels] = Histogram(HISTOGRAMS[metric][1])
+            _histograms[metric, labels].observe(value)
+        if status == 204:
+            _counters["dash_callback_prevented_total", labels] = _counters.get(("dash_callback_prevented_total", labels), 0) + 1
+        elif status >= 500:
+            _counters["dash_callback_errors_total", labels] = _counters.get(("dash_callback_errors_total", labels), 0) + 1
+
+
+def keep_profile(name: str, duration: float, profile: cProfile.Profile):
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    entry = (duration, time.time(), name, out.getvalue())
+    with _lock:
+        # a min-heap on duration keeps the slowest calls
+        if len(_profiles) < PROFILE_KEEP:
+            heapq.heappush(_profiles, entry)
+        elif duration > _profiles[0][0]:
+            heapq.heapreplace(_profiles, entry)
+
+
+def exposition() -> str:
+    lines = []
+    with _lock:
+        for metric, (help_text, _) in HISTOGRAMS.items():
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for (name, labels), histogram in sorted(_histograms.items()):
+                if name == metric:
+                    lines += histogram.lines(metric, labels)
+        for metric, help_text in COUNTERS.items():
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (name, labels), value in sorted(_counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def profiles() -> list[dict]:
+    with _lock:
+        entries = sorted(_profiles, reverse=True)
+    return [{"callback": name, "duration": duration, "time": at, "stats": stats} for duration, at, name, stats in entries]
+
+
+def instrument(app):
+    server = app.server
+
+    @server.before_request
+    def start_callback_timer():
+        # polls of background callbacks carry a cacheKey, the work itself happens in the job process
+        if request.path != CALLBACK_URL or "cacheKey" in request.args:
+            return
+        g.callback_started = (time.perf_counter(), time.thread_time())
+        if PROFILE_RATE and random.random() < PROFILE_RATE:
+            g.callback_profile = cProfile.Profile()
+            g.callback_profile.enable()
+
+    @server.after_request
+    def record_callback(response):
+        started = g.pop("callback_started", None)
+        if started is None:
+            return response
+        duration, cpu = time.perf_counter() - started[0], time.thread_time() - started[1]
+
+        body = request.get_json(silent=True) or {}
+        name = callback_name(app, body.get("output", ""))
+        profile = g.pop("callback_profile", None)
+        if profile is not None:
+            profile.disable()
+            keep_profile(name, duration, profile)
+
+        response_bytes = 0 if response.direct_passthrough else len(response.get_data())
+        record(name, duration, cpu, request.content_length or 0, response_bytes, response.status_code)
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(exposition(), mimetype="text/plain; version=0.0.4")
+
+    @server.route('/metrics/profiles')
+    def metrics_profiles():
+        return jsonify(profiles())
@@ -1,58 +1,27 @@
 import base64
 import copy
-import json
 import os
-import re
-import xml.dom.minidom
-import xml.etree.ElementTree as ET
 import zipfile
-from io import BytesIO
 from operator import itemgetter
 
 import dash
 import dash_bootstrap_components as dbc
-import pandas as pd
-import unicodedata
-from PIL import Image, ImageDraw, ImageFont
 from dash import Output, Input, ALL, State, html, dcc, clientside_callback
 from dash.exceptions import PreventUpdate
-from mako.template import Template
-from toolz import unique
 
+import janitor
+import jobs
+import previews
+import session_store
 from components.table import table
-from utils import base64_to_pil, random_string, hex_to_rgb, contains_vietnamese
+from core import players, rating_list
+from core.cards import DEFAULT_FONT, card_base, card_filename, render_card, render_preview, template_png
+from core.players import FIELDS, IMPORT_FIELDS, generate_players_xml, generate_teams_xml, export_players
+from utils import base64_to_pil, random_string, table_patch, TEMP_FOLDER, FONTS_FOLDER, lazy_import, ensure_folder
 
 from datetime import datetime
-import random
-
-FIELDS = {
-    "PlayerUniqueId": "Id",
-    "Name": "Name",
-    "Lastname": "Last Name",
-    "Firstname": "First Name",
-    "Gender": "Gender",
-    "Group": "Group",
-    "Rating": "Rating",
-    "Title": "Title",
-    "Federation": "Federation",
-    "FIDEId": "FIDE Id",
-    "Club": "Club",
-    "TeamUniqueId": "Team Id",
-    "Type": "Type",
-}
-
-TEMP_FOLDER = "./temp"
-FONTS_FOLDER = "./fonts"
-
-if not os.path.exists(TEMP_FOLDER):
-    os.makedirs(TEMP_FOLDER)
-if not os.path.exists(FONTS_FOLDER):
-    os.makedirs(FONTS_FOLDER)
-
-GLOBAL_CONTEXT = {
-    "datetime": datetime,
-    "random": random,
-}
+
+pd = lazy_import("pandas")
 
 dash.register_page(
     __name__,
@@ -61,12 +30,22 @@ dash.register_page(
 
 layout = dbc.Container([
     dbc.Row([
-        dcc.Upload(
-            dbc.Button([html.I(className="bi bi-box-arrow-in-down-right"), " Import from Excel"], className="w-fit"),
-            id="excel_upload_btn",
-            accept="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet, application/vnd.ms-excel",
-            className="!w-fit",
-        ),
+        dbc.Row([
+            dcc.Upload(
+                dbc.Button([html.I(className="bi bi-box-arrow-in-down-right"), " Import from Excel"], className="w-fit"),
+                id="excel_upload_btn",
+                accept="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet, application/vnd.ms-excel",
+                className="!w-fit",
+            ),
+            dcc.Upload(
+                dbc.Button([html.I(className="bi bi-database-down"), " Load FIDE rating list"], color="secondary", className="w-fit", id="rating_list_upload_label"),
+                id="rating_list_upload_btn",
+                accept=".xml, .txt, .zip",
+                className="!w-fit",
+            ),
+            html.Span(id="excel_import_status", className="w-fit my-auto text-sm text-gray-500"),
+            html.Span(id="rating_list_status", className="w-fit my-auto text-sm text-gray-500"),
+        ], className="flex flex-row gap-2 p-0 m-0 w-fit flex-nowrap"),
         dbc.Button(
             [html.I(className="bi bi-arrow-clockwise"), " Restore last session"],
             id="restore_session_btn",
@@ -130,6 +109,7 @@ layout = dbc.Container([
     dbc.Row([
         dbc.Row([
             dbc.Button("Auto fill group", id="fill_group", n_clicks=0, color="secondary", className="w-fit"),
+            dbc.Button("Auto fill from rating list", id="fill_rating", n_clicks=0, color="secondary", className="w-fit"),
             dbc.Button([html.I(className="bi bi-trash"), " Clear"], id="clear_btn", n_clicks=0, color="danger", className="w-fit"),
         ], className="flex flex-row gap-2 p-0 m-0 w-fit"),
         html.A(html.I(className="bi bi-info-circle w-fit mt-auto", id="info_tooltip_icon"), href="https://docs.makotemplates.org/en/latest/syntax.html", target="_blank", className="w-fit mt-auto"),
@@ -191,6 +171,14 @@ layout = dbc.Container([
                 "Generate all", id="generate_all", n_clicks=0, className=""
             ),
         ], label=[html.I(className="bi bi-download"), " Generate"], class_name="p-0 w-fit", id="generate_menu"),
+        dbc.DropdownMenu([
+            dbc.DropdownMenuItem(
+                "Export players to Excel", id="export_players_excel", n_clicks=0, className=""
+            ),
+            dbc.DropdownMenuItem(
+                "Export players to CSV", id="export_players_csv", n_clicks=0, className=""
+            ),
+        ], label=[html.I(className="bi bi-box-arrow-up-right"), " Export"], class_name="p-0 w-fit", id="export_players_menu"),
         dbc.Button([html.I(className="bi bi-card-image"), " Generate player cards"], id="card_open_btn", n_clicks=0, color="secondary", className="w-fit"),
     ], className="flex flex-row gap-2 p-0 m-0"),
     dbc.Accordion(
@@ -312,8 +300,11 @@ layout = dbc.Container([
                 ], className="mb-1"),
             ]), className="h-fit"),
             dbc.ModalFooter([
+                dbc.Progress(id="card_download_progress", value=0, max=1, className="hidden"),
+                dbc.Button([html.I(className="bi bi-x-circle"), " Cancel"], id="card_download_cancel_btn", color="danger", className="hidden", n_clicks=0),
                 dbc.Button([html.I(className="bi bi-file-earmark-image"), " Download current"], id="card_download_current_btn", className="ml-auto", n_clicks=0),
-                dbc.Button([html.I(className="bi bi-file-earmark-zip"), " Download all"], id="card_download_all_btn", className="", n_clicks=0)
+                dbc.Button([html.I(className="bi bi-file-earmark-zip"), " Download all"], id="card_download_all_btn", className="", n_clicks=0),
+                dcc.Store("card_download_url"),
             ]),
         ],
         id="card_modal",
@@ -324,10 +315,6 @@ layout = dbc.Container([
 ], className="flex flex-col gap-2 p-0")
 
 
-def generate_name(data: dict) -> dict:
-    return data | {k.lower(): v for k, v in data.items()} | {FIELDS[k].lower().replace(" ", "_"): v for k, v in data.items() if k in FIELDS}
-
-
 @dash.callback(
     Output("table", "data", allow_duplicate=True),
     Output('card_template_config', 'data', allow_duplicate=True),
@@ -342,18 +329,16 @@ def restore_session(n_clicks, data, card_template_config, client_id):
     if not client_id or dash.ctx.triggered_id != "restore_session_btn":
         raise PreventUpdate
 
-    session_file = os.path.join(TEMP_FOLDER, f"session_{client_id}.json")
-    if os.path.exists(session_file):
-        with open(session_file, "r", encoding="utf-8") as f:
-            data = pd.read_json(f, orient="records").fillna("").to_dict(orient="records")
+    store = session_store.get_store()
+    saved_players = store.get(client_id, "players")
+    if saved_players:
+        data = pd.DataFrame(saved_players).fillna("").to_dict(orient="records")
 
-    session2_file = os.path.join(TEMP_FOLDER, f"session2_{client_id}.json")
-    if os.path.exists(session2_file):
-        with open(session2_file, "r", encoding="utf-8") as f:
-            card_template_config = json.load(f)
+    card_template_config = store.get(client_id, "card_config", card_template_config)
 
     template_image_file = os.path.join(TEMP_FOLDER, f"{client_id}.png")
     if os.path.exists(template_image_file):
+        janitor.touch(template_image_file)
         card_template_image_store = template_image_file
     else:
         card_template_image_store = "./static/card_template.png"
@@ -376,23 +361,61 @@ def clear_table(n_clicks):
 @dash.callback(
     Output("table", "data", allow_duplicate=True),
     Input("fill_group", "n_clicks"),
-    Input("table", "data"),
+    State("table", "data"),
     prevent_initial_call=True,
 )
 def fill_group(n_clicks, data):
-    if not data or dash.ctx.triggered_id != "fill_group":
+    if not data or not n_clicks:
         raise PreventUpdate
 
-    for row in data:
-        if row.get("Gender", None):
-            print(row.get("Gender", "").strip().lower())
-            match row.get("Gender", "").strip().lower():
-                case "m" | "male" | "man" | "nam":
-                    row["Group"] = "m"
-                case "f" | "female" | "women" | "nu" | "nữ":
-                    row["Group"] = "f"
-        else:
-            row["Group"] = "m"
+    original = copy.deepcopy(data)
+    return table_patch(original, players.fill_groups(data))
+
+
+@dash.callback(
+    Output("rating_list_upload_label", "children"),
+    Output("rating_list_status", "children"),
+    Output("rating_list_upload_btn", "contents"),
+    Input("rating_list_upload_btn", "contents"),
+    background=True,
+    running=[
+        (Output("rating_list_upload_btn", "disabled"), True, False),
+        (Output("rating_list_upload_label", "disabled"), True, False),
+    ],
+    progress=[Output("rating_list_status", "children")],
+    prevent_initial_call=True,
+)
+def load_rating_list(set_progress, contents):
+    if not contents:
+        raise PreventUpdate
+
+    # a full list takes long enough to hit the worker timeout, so it is indexed in a job
+    set_progress(("Reading rating list...",))
+    try:
+        content_type, content_string = contents.split(',')
+        count = rating_list.build_index(
+            base64.b64decode(content_string),
+            progress=lambda n: set_progress((f"Indexing... {n:,} players",)),
+        )
+    except Exception as e:
+        return dash.no_update, f"Could not read the rating list: {e}", None
+
+    return [html.I(className="bi bi-database-check"), f" Rating list ({count} players)"], "", None
+
+
+@dash.callback(
+    Output("table", "data", allow_duplicate=True),
+    Input("fill_rating", "n_clicks"),
+    State("table", "data"),
+    prevent_initial_call=True,
+)
+def fill_rating(n_clicks, data):
+    if not data or not n_clicks or not rating_list.index_exists():
+        raise PreventUpdate
+
+    data, filled = rating_list.auto_fill(data)
+    if not filled:
+        raise PreventUpdate
 
     return data
 
@@ -407,24 +430,14 @@ def fill_group(n_clicks, data):
     prevent_initial_call=True,
 )
 def change_data(data):
+    original = copy.deepcopy(data) or []
     if not data:
         data = [{"": 1}]
     else:
-        data = [row for row in data if any(row.values())]
-
-        temp = [row for row in data if row.get("Federation", None) == ""]
-        data = list(unique(sorted([row for row in data if row.get("Federation", None) != ""],
-                                  key=lambda x: sum(v is None for v in x.values())),
-                           key=lambda x: x.get("Federation", "")))
-
-        data = data + temp
-
-        for i, row in enumerate(data):
-            row["TeamUniqueId"] = i + 1
-
+        data = players.number_teams(data)
         data.append({k: "" for k in FIELDS.keys()})
 
-    return data, not any([row.get("Federation", None) for row in data]), not any(
+    return table_patch(original, data), not any([row.get("Federation", None) for row in data]), not any(
         [row.get("TeamUniqueId", None) for row in data]), not any(
         [row.get("Federation", None) for row in data]), not any([row.get("TeamUniqueId", None) for row in data])
 
@@ -432,64 +445,46 @@ def change_data(data):
 @dash.callback(
     Output("table", "data", allow_duplicate=True),
     Input("fill_club", "n_clicks"),
-    Input("table_group", "data"),
-    Input("table", "data"),
+    State("table_group", "data"),
+    State("table", "data"),
     prevent_initial_call=True,
 )
 def fill_club(n_clicks, data_group, data):
-    if not data or dash.ctx.triggered_id != "fill_club":
+    if not data or not n_clicks:
         raise PreventUpdate
 
-    data_group = {row["Federation"]: row["Club"] for row in data_group if
-                  row.get("Federation", None) and row.get("Club", None)}
-
-    for row in data:
-        if row.get("Federation", None):
-            row["Club"] = data_group.get(row["Federation"], "")
-
-    return data
+    original = copy.deepcopy(data)
+    return table_patch(original, players.fill_from_teams(data, data_group, "Federation", "Club"))
 
 
 @dash.callback(
     Output("table", "data", allow_duplicate=True),
     Input("fill_team", "n_clicks"),
-    Input("table_group", "data"),
-    Input("table", "data"),
+    State("table_group", "data"),
+    State("table", "data"),
     prevent_initial_call=True,
 )
 def fill_team(n_clicks, data_group, data):
-    if not data or dash.ctx.triggered_id != "fill_team":
+    if not data or not n_clicks:
         raise PreventUpdate
 
-    data_group = {row["Federation"]: row["TeamUniqueId"] for row in data_group if
-                  row.get("Federation", None) and row.get("TeamUniqueId", None)}
-
-    for row in data:
-        if row.get("Federation", None):
-            row["TeamUniqueId"] = data_group.get(row["Federation"], "")
-
-    return data
+    original = copy.deepcopy(data)
+    return table_patch(original, players.fill_from_teams(data, data_group, "Federation", "TeamUniqueId"))
 
 
 @dash.callback(
     Output("table", "data", allow_duplicate=True),
     Input("fill_federation", "n_clicks"),
-    Input("table_group", "data"),
-    Input("table", "data"),
+    State("table_group", "data"),
+    State("table", "data"),
     prevent_initial_call=True,
 )
 def fill_federation(n_clicks, data_group, data):
-    if not data or dash.ctx.triggered_id != "fill_federation":
+    if not data or not n_clicks:
         raise PreventUpdate
 
-    data_group = {row["Club"]: row["Federation"] for row in data_group if
-                  row.get("Club", None) and row.get("Federation", None)}
-
-    for row in data:
-        if row.get("Club", None):
-            row["Federation"] = data_group.get(row["Club"], "")
-
-    return data
+    original = copy.deepcopy(data)
+    return table_patch(original, players.fill_from_teams(data, data_group, "Club", "Federation"))
 
 
 @dash.callback(
@@ -503,57 +498,11 @@ def fill_federation(n_clicks, data_group, data):
     prevent_initial_call=True,
 )
 def change_data(data, children, client_id):
-    group = dict()
-
-    name_dict = dict()
-    for i, row in enumerate(data):
-        for k, v in row.items():
-            row[k] = v.strip().replace("\n", " ") if isinstance(v, str) else v
-
-        row["PlayerUniqueId"] = i + 1
-        if row.get("Name", None):
-            name = re.sub(r"\(.*\)", '', unicodedata.normalize('NFC', row["Name"])).strip().replace(",", "")
-            name = ' '.join(map(lambda s: s.capitalize(), name.lower().split())).split()
-
-            if len(name) == 1:
-                row["Lastname"], row["Firstname"] = "", name[0]
-            else:
-                row["Lastname"], row["Firstname"] = name[0], " ".join(name[1:])
-        else:
-            row["Lastname"], row["Firstname"] = "", ""
-
-        if not contains_vietnamese(f"{row['Lastname']} {row['Firstname']}"):
-            row["localized"] = "true"
-
-        row["duplicate"] = "false"
-        if f"{row['Lastname']} {row['Firstname']}" in name_dict:
-            row["duplicate"] = "true"
-            name_dict[f"{row['Lastname']} {row['Firstname']}"]["duplicate"] = "true"
-        else:
-            name_dict[f"{row['Lastname']} {row['Firstname']}"] = row
-
-    if len(data) > 1:
-        for k, v in data[-1].items():
-            v = str(v)
-            if v.startswith("=") and k not in ("Name", "Lastname", "Firstname"):
-                v = v[1:]
-                for row in data[:-1]:
-                    try:
-                        row[k] = Template(v).render(**generate_name(row), **GLOBAL_CONTEXT)
-                    except Exception:
-                        try:
-                            row[k] = Template(v + "}").render(**generate_name(row), **GLOBAL_CONTEXT)
-                        except Exception as e:
-                            if "NameError" in str(e) or "SyntaxException" in str(e):
-                                row[k] = v
-                            else:
-                                row[k] = "#ERROR"
-                                raise e
+    original = copy.deepcopy(data)
+    data = players.apply_formulas(players.normalize_players(data))
 
     data = [row for row in data if row.get("Name", None)]
-    for row in data:
-        if row.get("Group", None):
-            group[row["Group"]] = group.get(row["Group"], 0) + 1
+    group = players.group_counts(data)
 
     if not data:
         data = [{"": 1}]
@@ -565,10 +514,9 @@ def change_data(data, children, client_id):
     else:
         if not client_id:
             client_id = random_string(12)
-        with open(os.path.join(TEMP_FOLDER, f"session_{client_id}.json"), "w", encoding="utf-8") as f:
-            pd.DataFrame(data).to_json(f, orient="records", force_ascii=False, indent=4)
+        session_store.get_store().put(client_id, "players", data)
 
-    return data, [children[0], *[dbc.DropdownMenuItem(
+    return table_patch(original, data), [children[0], *[dbc.DropdownMenuItem(
         f"Generate group {name}", id={"type": "generate_group", "index": name}, n_clicks=0, className="me-1", key=name
     ) for name in group]], dash.dash_table.DataTable(
         id="summarize_table_result",
@@ -592,58 +540,16 @@ def change_data(data, children, client_id):
     ), client_id
 
 
-def generate_players_xml(data, group=None):
-    root = ET.Element('Players')
-    for row in data:
-        if group:
-            if row.get("Group", None) != group:
-                continue
-
-        player = ET.SubElement(root, 'Player')
-        for k, v in row.items():
-            if not v or not k or k == "Name" or k not in FIELDS:
-                continue
-            player.set(k, str(v))
-
-    tree = ET.ElementTree(root)
-    result_str = ET.tostring(tree.getroot(), encoding="utf8").decode("utf8")
-
-    dom = xml.dom.minidom.parseString(result_str)
-    pretty_xml_as_string = dom.toprettyxml()
-
-    return pretty_xml_as_string
-
-
-def generate_teams_xml(data):
-    root = ET.Element('Teams')
-    for row in data:
-        team = ET.SubElement(root, 'Team')
-        team.set("TeamLongname", row.get("Club", ""))
-        team.set("TeamShortname", row.get("Federation", ""))
-        team.set("TeamUniqueId", str(row.get("TeamUniqueId", "")))
-
-    tree = ET.ElementTree(root)
-    result_str = ET.tostring(tree.getroot(), encoding="utf8").decode("utf8")
-
-    dom = xml.dom.minidom.parseString(result_str)
-    pretty_xml_as_string = dom.toprettyxml()
-
-    return pretty_xml_as_string
-
-
 @dash.callback(
     Output("download", "data", allow_duplicate=True),
     Input("generate_team", "n_clicks"),
-    Input("table_group", "data"),
+    State("table_group", "data"),
     prevent_initial_call=True,
 )
 def generate_team(n_clicks, data):
-    if dash.ctx.triggered_id != "generate_team":
+    if not n_clicks or not data:
         raise PreventUpdate
 
-    data = [row for row in data if row.get("TeamUniqueId", None)]
-    data = sorted(data, key=itemgetter("TeamUniqueId"))
-
     pretty_xml_as_string = generate_teams_xml(data)
 
     return dict(content=pretty_xml_as_string, filename="teams.xml")
@@ -653,11 +559,12 @@ def generate_team(n_clicks, data):
     Output("download", "data", allow_duplicate=True),
     Output({'type': 'generate_group', 'index': ALL}, 'n_clicks'),
     Input({'type': 'generate_group', 'index': ALL}, 'n_clicks'),
-    Input("table", "data"),
+    State("table", "data"),
     prevent_initial_call=True,
 )
 def generate_group(n_clicks, data):
-    if dash.ctx.triggered_id == "table":
+    # the menu items are rebuilt on every table edit, which fires this with n_clicks at 0
+    if not dash.ctx.triggered_id or not any(n_clicks):
         raise PreventUpdate
 
     pretty_xml_as_string = generate_players_xml(data, group=dash.ctx.triggered_id["index"])
@@ -668,11 +575,11 @@ def generate_group(n_clicks, data):
 @dash.callback(
     Output("download", "data", allow_duplicate=True),
     Input("generate_all", "n_clicks"),
-    Input("table", "data"),
+    State("table", "data"),
     prevent_initial_call=True,
 )
 def download_text(n_clicks, data):
-    if dash.ctx.triggered_id != "generate_all":
+    if not n_clicks:
         raise PreventUpdate
 
     pretty_xml_as_string = generate_players_xml(data)
@@ -680,11 +587,19 @@ def download_text(n_clicks, data):
     return dict(content=pretty_xml_as_string, filename="output.xml")
 
 
-def read_excel(content: str, sheet: str | None) -> pd.DataFrame | dict[str, pd.DataFrame]:
-    content_type, content_string = content.split(',')
-    decoded = base64.b64decode(content_string)
-    df = pd.read_excel(BytesIO(decoded), sheet_name=sheet)
-    return df
+@dash.callback(
+    Output("download", "data", allow_duplicate=True),
+    Input("export_players_excel", "n_clicks"),
+    Input("export_players_csv", "n_clicks"),
+    State("table", "data"),
+    prevent_initial_call=True,
+)
+def download_players(n_clicks_excel, n_clicks_csv, data):
+    if not data or dash.ctx.triggered_id not in ("export_players_excel", "export_players_csv"):
+        raise PreventUpdate
+
+    file_format = "csv" if dash.ctx.triggered_id == "export_players_csv" else "xlsx"
+    return dcc.send_bytes(export_players(data, file_format), filename=f"players.{file_format}")
 
 
 @dash.callback(
@@ -698,12 +613,18 @@ def read_excel(content: str, sheet: str | None) -> pd.DataFrame | dict[str, pd.D
         Input("excel_upload_btn", "contents"),
         Input("excel_sheet_select", "value"),
     ],
+    background=True,
+    running=[
+        (Output("excel_upload_btn", "disabled"), True, False),
+        (Output("excel_import_status", "children"), "Reading workbook...", ""),
+    ],
     prevent_initial_call=True,
 )
 def toggle_excel_import_modal(contents, sheet):
     if not contents:
         raise PreventUpdate
-    data = read_excel(contents, None)
+    content_type, content_string = contents.split(',')
+    data = players.read_excel(base64.b64decode(content_string), None)
     sheets = tuple(data.keys())
     if sheet in data.keys():
         data = data[sheet]
@@ -755,7 +676,7 @@ def toggle_excel_import_modal(contents, sheet):
                     'filter_query': '{No} eq 0'
                 },
                 "clearable": True,
-                'options': [{'label': v, 'value': v} for k, v in FIELDS.items() if k not in ("PlayerUniqueId", "Firstname", "Lastname")],
+                'options': [{'label': v, 'value': v} for v in IMPORT_FIELDS.values()],
             } for col in data.columns if col != "No"],
         ),
         [{"label": sheet, "value": sheet} for sheet in sheets],
@@ -793,26 +714,12 @@ def import_excel(n_clicks, n_clicks2, data, table_data):
     if not data or not data[0]:
         raise PreventUpdate
 
-    data = data[0]
-    data = pd.DataFrame(data)
-    first_row = data.iloc[0]
-    data = data.iloc[1:].reset_index(drop=True)
-
-    if len([v for v in first_row.to_list() if v]) != len(set(v for v in first_row.to_list() if v)):
+    data = players.import_rows(data[0])
+    if data is None:
         raise PreventUpdate
 
-    for col in first_row.keys():
-        if first_row[col] and any(FIELDS[f] == first_row[col] for f in FIELDS.keys()):
-            data.rename(columns={col: next(f for f in FIELDS if FIELDS[f] == first_row[col])}, inplace=True)
-        else:
-            del data[col]
-
-    data.fillna("", inplace=True)
-
-    if dash.ctx.triggered_id == "excel_import_btn":
-        data = data.to_dict('records')
-    else:
-        data = table_data + data.to_dict('records')
+    if dash.ctx.triggered_id != "excel_import_btn":
+        data = table_data + data
         if data[0] == {"": 1}:
             data = data[1:]
     return False, data
@@ -844,8 +751,10 @@ def toggle_card_modal(n_clicks, template, data, current_template, current_select
     else:
         if not client_id:
             client_id = random_string(12)
-        path = f"{TEMP_FOLDER}/{client_id}.png"
-        base64_to_pil(template).save(path, format="PNG")
+        path = f"{ensure_folder(TEMP_FOLDER)}/{client_id}.png"
+        # written aside and swapped in, so another worker never reads a half written image
+        base64_to_pil(template).save(f"{path}.{os.getpid()}.tmp", format="PNG")
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
 
     return True, path, [{"label": "------", "value": "0"}] + [
         {"label": f"Id #{row['PlayerUniqueId']} {row['Lastname']} {row['Firstname']}", "value": row["PlayerUniqueId"]}
@@ -870,7 +779,7 @@ def upload_font(contents, filename, data):
     content_type, content_string = contents.split(',')
     decoded = base64.b64decode(content_string)
 
-    font_path = os.path.join(FONTS_FOLDER, filename)
+    font_path = os.path.join(ensure_folder(FONTS_FOLDER), filename)
     with open(font_path, 'wb') as f:
         f.write(decoded)
 
@@ -1113,6 +1022,18 @@ clientside_callback(
                     "minHeight": 0,
                 },
             },
+            "qr": {
+                "type": "qr",
+                "anchor": "mm",
+                "offsetX": 0,
+                "offsetY": 200,
+                "size": 120,
+                "border": 1,
+                "color": "#000000",
+                "backColor": "#FFFFFF",
+                "template": "",
+                "groupId": "",
+            },
         };
         
         const schema = {
@@ -1154,7 +1075,8 @@ clientside_callback(
                 "name": { "$ref": "#/definitions/labelBlock" },
                 "club": { "$ref": "#/definitions/labelBlock" },
                 "group": { "$ref": "#/definitions/labelBlock" },
-                "id": { "$ref": "#/definitions/labelBlock" }
+                "id": { "$ref": "#/definitions/labelBlock" },
+                "qr": { "$ref": "#/definitions/qrBlock" }
             },
             "definitions": {
                 "labelBlock": {
@@ -1169,6 +1091,22 @@ clientside_callback(
                             ],
                         },
                     },
+                },
+                "qrBlock": {
+                    "type": "object",
+                    "properties": {
+                        "type": { "type": "string", "enum": ["text", "qr"], "default": "qr" },
+                        "anchor": {
+                            "type": "string",
+                            "enum": [
+                                "mm", "ma", "mt", "ms", "mb", "md",
+                                "lm", "la", "lt", "ls", "lb", "ld",
+                                "rm", "ra", "rt", "rs", "rb", "rd",
+                            ],
+                        },
+                        "size": { "type": "number", "default": 120 },
+                        "border": { "type": "number", "default": 1 },
+                    },
                 }
             }
         }
@@ -1196,90 +1134,6 @@ clientside_callback(
 )
 
 
-def draw_text(img: Image, row: dict, row_config: dict, config: dict) -> Image:
-    if not row:
-        return img
-    try:
-        text = Template(row_config["template"]).render(**generate_name(row))
-    except NameError:
-        text = row_config["template"]
-    if not text:
-        return img
-    text = unicodedata.normalize('NFC', text)
-
-    img = img.copy()
-    row_config = copy.deepcopy(row_config)
-    d = ImageDraw.Draw(img)
-
-    font_path = config["font"] if config.get("font", None) else "./Roboto.ttf"
-    font_size = row_config["maxFontSize"]
-    try:
-        font = ImageFont.truetype(font_path, font_size)
-    except OSError:
-        font_path = "./Roboto.ttf"
-        font = ImageFont.truetype(font_path, font_size)
-    while d.textlength(text, font) >= row_config["maxWidth"]:
-        font_size -= 1
-        row_config["maxWidth"] = row_config["maxWidth"] * row_config["maxWidthCompensate"]
-        row_config["offsetX"] = row_config["offsetX"] * row_config["offsetXCompensate"]
-        row_config["offsetY"] = row_config["offsetY"] * row_config["offsetYCompensate"]
-        font = ImageFont.truetype(font_path, font_size)
-
-    center = img.width // 2, img.height // 2
-    center = (
-        center[0] + row_config["offsetX"],
-        center[1] + row_config["offsetY"]
-    )
-
-    if row_config["border"]["strokeWeight"] > 0:
-        left, top, right, bottom = d.textbbox(center, text, font=font, anchor=row_config["anchor"])
-        color = Template(row_config["border"]["color"]).render(**generate_name(row), **GLOBAL_CONTEXT)
-        box = [
-            left - row_config["border"]["padding"]["left"],
-            top - row_config["border"]["padding"]["top"],
-            right + row_config["border"]["padding"]["right"],
-            bottom + row_config["border"]["padding"]["bottom"]
-        ]
-
-        if row_config["border"]["minWidth"] > 0 and (box[2] - box[0]) < row_config["border"]["minWidth"]:
-            min_width = row_config["border"]["minWidth"]
-            if row_config["anchor"][0] == "l":
-                box[2] += min_width - (box[2] - box[0])
-            elif row_config["anchor"][0] == "r":
-                box[0] -= min_width - (box[2] - box[0])
-            else:
-                center_x = (box[0] + box[2]) // 2
-                half_width = min_width // 2
-                box[0] = center_x - half_width
-                box[2] = center_x + (min_width - half_width)
-        if row_config["border"]["minHeight"] > 0 and (box[3] - box[1]) < row_config["border"]["minHeight"]:
-            min_height = row_config["border"]["minHeight"]
-            if row_config["anchor"][1] == "t":
-                box[3] += min_height - (box[3] - box[1])
-            elif row_config["anchor"][1] == "b":
-                box[1] -= min_height - (box[3] - box[1])
-            else:
-                center_y = (box[1] + box[3]) // 2
-                half_height = min_height // 2
-                box[1] = center_y - half_height
-                box[3] = center_y + (min_height - half_height)
-
-        d.rounded_rectangle(
-            box,
-            outline=color,
-            width=row_config["border"]["strokeWeight"],
-            fill=None if not row_config["border"]["fill"] else Template(row_config["border"]["fill"]).render(**generate_name(row), **GLOBAL_CONTEXT),
-            radius=row_config["border"]["radius"]
-        )
-
-    try:
-        d.text(center, text, fill=Template(row_config["color"]).render(**generate_name(row), **GLOBAL_CONTEXT), anchor=row_config["anchor"], font=font)
-    except NameError:
-        d.text(center, text, fill="#000000", anchor=row_config["anchor"], font=font)
-
-    return img
-
-
 @dash.callback(
     Output("card_preview_image", "src", allow_duplicate=True),
     Output("client_id", "data", allow_duplicate=True),
@@ -1294,86 +1148,17 @@ def update_card_preview_image(template, config, preview, data, client_id):
     if not template:
         raise PreventUpdate
     if not config:
-        image = Image.open(template).convert("RGBA")
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        return f"data:image/png;base64,{img_str}", client_id
-
-    image = Image.open(template).convert("RGBA")
-    if config["config"]["scale"]["width"] > 0 and config["config"]["scale"]["height"] > 0:
-        image = image.resize((config["config"]["scale"]["width"], config["config"]["scale"]["height"]))
-    elif config["config"]["scale"]["width"] > 0:
-        image.thumbnail((config["config"]["scale"]["width"], image.height))
-    elif config["config"]["scale"]["height"] > 0:
-        image.thumbnail((image.width, config["config"]["scale"]["height"]))
-    overlay = Image.new("RGBA", image.size, (255, 255, 255, 0))
-    pattern = r'#(?:[A-Fa-f0-9]{3}|[A-Fa-f0-9]{6}|[A-Fa-f0-9]{4}|[A-Fa-f0-9]{8})\b'
-
-    d = ImageDraw.Draw(image)
-    if preview == "0":
-        d.line(((0, image.height // 2), (image.width, image.height // 2)), "gray")
-        d.line(((image.width // 2, 0), (image.width // 2, image.height)), "gray")
-
-    d = ImageDraw.Draw(overlay)
-
-    groups = {}
-    if not config["config"].get("font", None):
-        config["config"]["font"] = "./Roboto.ttf"
-    for k, value in config.items():
-        if k == "config":
-            continue
-
-        if preview == "0":
-            center = image.width // 2, image.height // 2
-            center = (
-                center[0] + value["offsetX"],
-                center[1] + value["offsetY"]
-            )
-            text = ""
-            font = ImageFont.truetype(config["config"]["font"], value["maxFontSize"])
-            while d.textlength(text, font) < value["maxWidth"]:
-                text += "A"
-            left, top, right, bottom = d.textbbox(center, text, font=font, anchor=value["anchor"])
-            color = re.search(pattern, value["color"])
-            d.rectangle(
-                [left, top, right, bottom],
-                fill=hex_to_rgb(color.group() if color else "#000000") + (128,),
-                outline=hex_to_rgb(color.group() if color else "#000000")
-            )
-            if value.get("groupId", None):
-                groups.setdefault(value["groupId"], []).append((left, top, right, bottom))
-        else:
-            row = next((r for r in data if r.get("PlayerUniqueId") == int(preview)), None)
-            overlay = draw_text(overlay, row, value, config["config"])
-
-    for group in groups.values():
-        if preview != "0" or len(group) == 1:
-            continue
-        if len(group) > 1:
-            left = min(x[0] for x in group)
-            top = min(x[1] for x in group)
-            right = max(x[2] for x in group)
-            bottom = max(x[3] for x in group)
-            d.rectangle(
-                [left, top, right, bottom],
-                outline="red",
-                width=3
-            )
+        return previews.preview_url(template_png(template), "png"), client_id
 
-    image = Image.alpha_composite(image, overlay).convert("RGB")
-    image.thumbnail((1200, 1200))
-
-    buffered = BytesIO()
-    image.save(buffered, format="JPEG")
-    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-    result = f"data:image/jpeg;base64,{img_str}"
+    if not config["config"].get("font", None):
+        config["config"]["font"] = DEFAULT_FONT
+    result = previews.preview_url(render_preview(template, config, preview, data), "jpg")
 
     if not client_id:
         client_id = random_string(12)
     if template != "./static/card_template.png":
-        with open(os.path.join(TEMP_FOLDER, f"session2_{client_id}.json"), "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        janitor.touch(template)
+        session_store.get_store().put(client_id, "card_config", config)
 
     return result, client_id
 
@@ -1381,79 +1166,83 @@ def update_card_preview_image(template, config, preview, data, client_id):
 @dash.callback(
     Output("download", "data", allow_duplicate=True),
     Input("card_download_current_btn", "n_clicks"),
-    Input("card_download_all_btn", "n_clicks"),
     State("card_template_image_store", "data"),
     State("card_template_config", "data"),
     State("table", "data"),
     State("card_preview_select", "value"),
     running=[
         (Output("card_download_current_btn", "disabled"), True, False),
+    ],
+    prevent_initial_call=True,
+)
+def download_card(n_clicks, template, config, data, current):
+    if not template or not config or not data:
+        raise PreventUpdate
+    if not current or current == "0":
+        raise PreventUpdate
+    try:
+        current_id = int(current)
+    except (TypeError, ValueError):
+        raise PreventUpdate
+
+    row = next((r for r in data if int(r.get("PlayerUniqueId", -1)) == current_id), None)
+    if not row:
+        raise PreventUpdate
+
+    return dcc.send_bytes(
+        render_card(card_base(template, config.get("config", {})), config, row),
+        filename=card_filename(config, row),
+    )
+
+
+@dash.callback(
+    Output("card_download_url", "data"),
+    Input("card_download_all_btn", "n_clicks"),
+    State("card_template_image_store", "data"),
+    State("card_template_config", "data"),
+    State("table", "data"),
+    background=True,
+    running=[
         (Output("card_download_all_btn", "disabled"), True, False),
+        (Output("card_download_current_btn", "disabled"), True, False),
+        (Output("card_download_cancel_btn", "className"), "", "hidden"),
+        (Output("card_download_progress", "className"), "w-48 my-auto", "hidden"),
     ],
+    progress=[
+        Output("card_download_progress", "value"),
+        Output("card_download_progress", "max"),
+        Output("card_download_progress", "label"),
+    ],
+    cancel=[Input("card_download_cancel_btn", "n_clicks")],
     prevent_initial_call=True,
 )
-def download_card(n_clicks_current, n_clicks_all, template, config, data, current):
+def download_all_cards(set_progress, n_clicks, template, config, data):
     if not template or not config or not data:
         raise PreventUpdate
 
-    conf = config.get("config", {})
-    scale = conf.get("scale", {}) or {}
-    dpi_cfg = conf.get("dpi", {}) or {}
-    out_format = conf.get("outputFormat", "png")
-    dpi = (int(dpi_cfg.get("width", 72)), int(dpi_cfg.get("height", 72)))
-    layers = [(k, v) for k, v in config.items() if k != "config"]
-    triggered = dash.ctx.triggered_id
-
-    with Image.open(template) as im:
-        base = im.convert("RGBA")
-
-    target_w = int(scale.get("width") or 0)
-    target_h = int(scale.get("height") or 0)
-    if target_w > 0 and target_h > 0:
-        base = base.resize((target_w, target_h), Image.LANCZOS)
-    elif target_w > 0:
-        new_h = max(1, round(base.height * (target_w / base.width)))
-        base = base.resize((target_w, new_h), Image.LANCZOS)
-    elif target_h > 0:
-        new_w = max(1, round(base.width * (target_h / base.height)))
-        base = base.resize((new_w, target_h), Image.LANCZOS)
-
-    def render_card(row):
-        overlay = Image.new("RGBA", base.size, (255, 255, 255, 0))
-        for k, value in layers:
-            overlay = draw_text(overlay, row, value, conf)
-        return Image.alpha_composite(base, overlay)
-
-    if triggered == "card_download_current_btn":
-        if not current or current == "0":
-            raise PreventUpdate
-        try:
-            current_id = int(current)
-        except (TypeError, ValueError):
-            raise PreventUpdate
-
-        row = next((r for r in data if int(r.get("PlayerUniqueId", -1)) == current_id), None)
-        if not row:
-            raise PreventUpdate
-
-        result = render_card(row).convert("RGB")
-        buf = BytesIO()
-        result.save(buf, format=out_format, dpi=dpi)
-        return dcc.send_bytes(buf.getvalue(), filename=f"player_card_#{row['PlayerUniqueId']}.{out_format}")
-
-    zip_path = os.path.join(TEMP_FOLDER, f"player_cards_{datetime.now():%Y%m%d_%H%M%S}.zip")
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(
-            zip_path, mode="w", compression=zipfile.ZIP_STORED
-    ) as zf, zipfile.ZipFile(zip_buffer, mode="w", compression=zipfile.ZIP_STORED) as zb:
-        for row in data:
-            if not row.get("PlayerUniqueId", None):
-                continue
-            card_img = render_card(row).convert("RGB")
-            out = BytesIO()
-            card_img.save(out, format=out_format, dpi=dpi)
-            zb.writestr(f"player_card_#{row['PlayerUniqueId']}.{out_format}", out.getvalue())
-            zf.writestr(f"player_card_#{row['PlayerUniqueId']}.{out_format}", out.getvalue())
-            print(f"Saved card for {row['PlayerUniqueId']} {row.get('Lastname', '')} {row.get('Firstname', '')}")
-
-    return dcc.send_bytes(zip_buffer.getvalue(), filename=f"player_cards_{datetime.now():%Y%m%d_%H%M%S}.zip")
+    rows = [row for row in data if row.get("PlayerUniqueId", None)]
+    base = card_base(template, config.get("config", {}))
+    step = jobs.progress_step(len(rows))
+
+    path, url = jobs.job_file(f"player_cards_{datetime.now():%Y%m%d_%H%M%S}.zip")
+    # every card written also bumps the mtime, so the zip stays inside the janitor's grace period until it is done
+    with janitor.in_use(path), zipfile.ZipFile(path, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for i, row in enumerate(rows):
+            zf.writestr(card_filename(config, row), render_card(base, config, row))
+            if (i + 1) % step == 0 or i + 1 == len(rows):
+                set_progress((i + 1, len(rows), f"{i + 1}/{len(rows)}"))
+
+    return url
+
+
+clientside_callback(
+    """
+    function(url) {
+        if (url) {
+            window.location.href = url;
+        }
+    }
+    """,
+    Input("card_download_url", "data"),
+    prevent_initial_call=True,
+)
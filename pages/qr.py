@@ -1,15 +1,15 @@
 import base64
-import re
-from io import BytesIO
+from urllib.parse import parse_qsl, urlsplit
 
 import dash
 import dash_bootstrap_components as dbc
-import numpy
-import plotly.express as px
-import qrcode
-from dash import Output, Input, ALL, State, dcc
+from dash import Output, Input, ALL, State, dcc, html, clientside_callback
 from dash.exceptions import PreventUpdate
 
+import session_store
+from core.players import fill_rows, read_rows
+from core.qr_codes import qr_png, qr_query, qr_query_options, qr_options, render_payloads, unique_names, bulk_qr_png, qr_zip, qr_sheet
+
 dash.register_page(
     __name__,
     path='/qr',
@@ -36,7 +36,7 @@ layout = dbc.Container([
             ], className="w-fit m-0"),
             dbc.Container([
                 dbc.FormFloating([
-                    dbc.Input(id="border_qr", type="number", value=1, min=0),
+                    dbc.Input(id="border_qr", type="number", value=1, min=0, max=100),
                     dbc.Label("Border size (box size unit)"),
                 ], className="w-fit m-0"),
             ], className="w-fit m-0"),
@@ -47,7 +47,7 @@ layout = dbc.Container([
                 ], className="w-fit m-0"),
                 dbc.Checklist(
                     options=[
-                        {"label": "Transparent", "value": 1, "disabled": True},  # fill color does not support transparency
+                        {"label": "Transparent", "value": 1},
                     ],
                     value=[],
                     id="fill_color_transparent_qr",
@@ -75,6 +75,54 @@ layout = dbc.Container([
         dbc.Button("Download", color="info", id="download_btn_qr", className="w-fit", disabled=True),
         dbc.Button("Raw", color="info", id="raw_qr", className="w-fit", disabled=True, target="_blank"),
     ], className="flex flex-row gap-2 mt-2 ml-0"),
+    dbc.Accordion(
+        [
+            dbc.AccordionItem(
+                dbc.Container([
+                    html.P(
+                        "The text above is used as a Mako template for every row, e.g. https://ratings.fide.com/profile/${FIDEId}",
+                        className="text-sm text-gray-500 m-0",
+                    ),
+                    dbc.Row([
+                        dcc.Upload(
+                            dbc.Button([html.I(className="bi bi-box-arrow-in-down-right"), " Upload list"], color="secondary", className="w-fit"),
+                            id="bulk_upload_qr",
+                            accept=".xlsx, .csv",
+                            className="!w-fit p-0",
+                        ),
+                        dbc.Button([html.I(className="bi bi-people"), " Use players table"], id="bulk_players_qr", color="secondary", className="w-fit"),
+                        html.Div(id="bulk_info_qr", className="w-fit my-auto text-sm text-gray-500"),
+                    ], className="flex flex-row gap-2 m-0"),
+                    dbc.InputGroup([
+                        dbc.InputGroupText("File name"),
+                        dbc.Input(id="bulk_name_qr", value="qr_${PlayerUniqueId}"),
+                    ]),
+                    dbc.InputGroup([
+                        dbc.InputGroupText("Label"),
+                        dbc.Input(id="bulk_label_qr", value="${Name}"),
+                    ]),
+                    dbc.RadioItems(
+                        id="bulk_format_qr",
+                        options=[
+                            {"label": "ZIP of images", "value": "zip"},
+                            {"label": "Printable sheet (PDF)", "value": "pdf"},
+                        ],
+                        value="zip",
+                        inline=True,
+                    ),
+                    dbc.Row([
+                        dbc.Button([html.I(className="bi bi-file-earmark-zip"), " Generate bulk"], id="bulk_generate_qr", className="w-fit", disabled=True),
+                        html.Div(id="bulk_status_qr", className="w-fit my-auto text-sm text-gray-500"),
+                    ], className="flex flex-row gap-2 m-0"),
+                    dcc.Store("bulk_rows_qr"),
+                    dcc.Store("bulk_client_id_qr"),
+                ], className="flex flex-col gap-2 p-0"),
+                title="Bulk generate",
+            ),
+        ],
+        start_collapsed=True,
+        className="mt-2",
+    ),
     dcc.Download(id="download_qr"),
     dbc.Container([], className="w-full", id="qr"),
     dcc.Location(id="url_qr"),
@@ -106,32 +154,24 @@ def generate(
 ):
     if n_clicks is None:
         raise PreventUpdate
+    # /qr.png answers an empty text with a 400, clear the image instead of showing a broken one
+    if not (input_qr or "").strip():
+        return []
 
-    # test
-    qr = qrcode.QRCode(
-        version=input_qr_size if input_qr_size and (input_qr_size > 0) else None,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=input_box_size if input_box_size and (input_box_size > 0) else 20,
-        border=input_border_size if input_border_size and (input_border_size > 0) else 0,
-    )
-    qr.add_data(input_qr)
-    qr.make(fit=True)
-
-    img = qr.make_image(
-        fill_color=(input_fill_color if input_fill_color else "black") if not input_fill_color_transparent else "transparent",
-        back_color=(input_back_color if input_back_color else "white") if not input_back_color_transparent else "transparent",
-    ).convert("RGBA")
-
-    fig = px.imshow(
-        numpy.array(img),
-        binary_format="png",
-        labels=dict(x="px", y="px"),
-    )
+    src = "/qr.png?" + qr_query(input_qr, qr_options(
+        input_qr_size,
+        input_box_size,
+        input_border_size,
+        input_fill_color,
+        input_back_color,
+        input_fill_color_transparent,
+        input_back_color_transparent,
+    ))
 
     return [
-        dcc.Graph(
-            figure=fig,
-            className="w-full inline-block",
+        html.Img(
+            src=src,
+            className="max-w-full h-auto mx-auto block",
             id={"type": "qr_container", "index": "qr_img"},
         ),
     ]
@@ -151,27 +191,108 @@ def toggle_transparent(back_color_transparent, fill_color_transparent):
     Output("download_btn_qr", "disabled"),
     Output("raw_qr", "disabled"),
     Output("raw_qr", "href"),
-    Input({'type': 'qr_container', 'index': ALL}, "figure"),
+    Input({'type': 'qr_container', 'index': ALL}, "src"),
 )
-def enable_buttons(fig):
-    if not fig:
-        raise PreventUpdate
+def enable_buttons(src):
+    if not src:
+        return True, True, None
 
-    return False, False, fig[0]["data"][0]["source"]
+    return False, False, src[0]
 
 
 @dash.callback(
     Output("download_qr", "data"),
     Input("download_btn_qr", "n_clicks"),
-    State({'type': 'qr_container', 'index': ALL}, "figure"),
+    State({'type': 'qr_container', 'index': ALL}, "src"),
 )
-def download_qr(n_clicks, fig):
-    if n_clicks is None:
+def download_qr(n_clicks, src):
+    if n_clicks is None or not src:
+        raise PreventUpdate
+
+    try:
+        payload, options = qr_query_options(dict(parse_qsl(urlsplit(src[0]).query)))
+        image = qr_png(payload, options)
+    except ValueError:
+        raise PreventUpdate
+
+    return dcc.send_bytes(image, filename="qr.png")
+
+
+clientside_callback(
+    """
+    function(n_clicks) {
+        return JSON.parse(window.localStorage.getItem("client_id"));
+    }
+    """,
+    Output("bulk_client_id_qr", "data"),
+    Input("bulk_players_qr", "n_clicks"),
+    prevent_initial_call=True,
+)
+
+
+@dash.callback(
+    Output("bulk_rows_qr", "data"),
+    Output("bulk_info_qr", "children"),
+    Output("bulk_generate_qr", "disabled"),
+    Input("bulk_upload_qr", "contents"),
+    Input("bulk_client_id_qr", "data"),
+    State("bulk_upload_qr", "filename"),
+    prevent_initial_call=True,
+)
+def load_bulk_rows(contents, client_id, filename):
+    if dash.ctx.triggered_id == "bulk_upload_qr" and contents:
+        content_type, content_string = contents.split(',')
+        rows = read_rows(base64.b64decode(content_string), filename or "")
+    elif dash.ctx.triggered_id == "bulk_client_id_qr" and client_id:
+        players = session_store.get_store().get(client_id, "players")
+        if not players:
+            return None, "No players table saved yet", True
+        rows = fill_rows(players)
+    else:
+        raise PreventUpdate
+
+    return rows, f"{len(rows)} rows loaded", not rows
+
+
+@dash.callback(
+    Output("download_qr", "data", allow_duplicate=True),
+    Output("bulk_status_qr", "children"),
+    Input("bulk_generate_qr", "n_clicks"),
+    State("bulk_rows_qr", "data"),
+    State("input_qr", "value"),
+    State("bulk_name_qr", "value"),
+    State("bulk_label_qr", "value"),
+    State("bulk_format_qr", "value"),
+    State("size_qr", "value"),
+    State("box_size_qr", "value"),
+    State("border_qr", "value"),
+    State("fill_color_qr", "value"),
+    State("back_color_qr", "value"),
+    State("fill_color_transparent_qr", "value"),
+    State("back_color_transparent_qr", "value"),
+    running=[
+        (Output("bulk_generate_qr", "disabled"), True, False),
+    ],
+    prevent_initial_call=True,
+)
+def bulk_generate(n_clicks, rows, template, name_template, label_template, output_format, *options):
+    if not n_clicks or not rows or not template:
         raise PreventUpdate
 
-    img = re.sub('^data:image/.+;base64,', '', fig[0]["data"][0]["source"])
+    try:
+        payloads, failed = render_payloads(template, rows)
+        images = bulk_qr_png(payloads, qr_options(*options))
+        if output_format == "pdf":
+            labels, _ = render_payloads(label_template or "", rows)
+            download = dcc.send_bytes(qr_sheet(labels, payloads, images), filename="qr_codes.pdf")
+        else:
+            names, _ = render_payloads(name_template or "qr", rows)
+            download = dcc.send_bytes(qr_zip(unique_names(names), payloads, images), filename="qr_codes.zip")
+    except ValueError as e:
+        # a malformed template, or a code wider than MAX_QR_PIXELS
+        return dash.no_update, str(e)
 
-    return dcc.send_bytes(
-        BytesIO(base64.b64decode(img)).getvalue(),
-        filename="qr.png",
-    )
+    status = f"{len(images)} QR codes generated"
+    if failed:
+        status += f", {failed} rows could not be rendered"
+    return download, status
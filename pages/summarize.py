@@ -1,25 +1,45 @@
-from io import BytesIO
-from operator import itemgetter
+import base64
+import copy
+import shutil
+import zipfile
 from typing import Literal
 
 import dash
 import dash_bootstrap_components as dbc
-import pandas
-import plotly.express as px
-from dash import Output, Input, dcc
+import plotly.graph_objects as go
+from dash import Output, Input, State, Patch, dcc, html, clientside_callback
 from dash.exceptions import PreventUpdate
-from openpyxl import Workbook
-from openpyxl.cell import Cell
-from openpyxl.styles import Font, PatternFill
+from plotly.colors import qualitative
 
+import jobs
 from components.table import table
-from utils import parse_number, autofit_columns
+from core import standings, team_names
+from core.summary import chart_data, incremental_rank_teams, export_summary, read_sections, aggregate_sections, write_sections
+from core.tie_breaks import TIE_BREAKS, DEFAULT_TIE_BREAKS
+from utils import random_string, table_patch
 
 dash.register_page(
     __name__,
     path='/summarize',
 )
 
+SERIES = {"rank": "Rank", "score": "Score", "tb1": "TB1", "tb2": "TB2", "tb3": "TB3", "tb4": "TB4", "tb5": "TB5"}
+CHART_TEAMS = 30
+WEBGL_THRESHOLD = 100
+
+
+def summary_figure():
+    return go.Figure(
+        data=[go.Bar(x=[], y=[], name=k, marker_color=color) for k, color in zip(SERIES, qualitative.Plotly)],
+        layout=dict(
+            barmode="group",
+            title="Summary of teams",
+            xaxis_title="Team",
+            yaxis_title="Value",
+            legend_title="variable",
+        ),
+    )
+
 layout = dbc.Container([
     dbc.Accordion(
         [
@@ -47,12 +67,45 @@ layout = dbc.Container([
                     dbc.Row([
                         dbc.Col(dbc.Button("Replace name long -> short", id="replace_lts", n_clicks=0, color="secondary", disabled=True, className="me-1 w-fit"), width="auto"),
                         dbc.Col(dbc.Button("Replace name short -> long", id="replace_stl", n_clicks=0, color="secondary", disabled=True, className="me-1 w-fit"), width="auto"),
+                        dbc.Col(dbc.Checklist(
+                            options=[{"label": "Fuzzy match", "value": 1}],
+                            value=[],
+                            id="replace_fuzzy",
+                            className="w-fit text-sm",
+                        ), width="auto", className="my-auto"),
                     ]),
+                    html.Div(id="replace_unresolved", className="text-sm text-gray-500"),
                 ], className="flex flex-col gap-2 p-0"), title="Convert team name",
             ),
         ],
         start_collapsed=True
     ),
+    dbc.Row([
+        dcc.Upload(
+            dbc.Button([html.I(className="bi bi-box-arrow-in-down-right"), " Import standings"], className="w-fit"),
+            id="standings_upload_btn",
+            accept=".xlsx, .html, .htm, .trf, .txt",
+            className="!w-fit",
+        ),
+        html.Span(id="standings_import_status", className="w-fit my-auto text-sm text-gray-500"),
+        dcc.Upload(
+            dbc.Button([html.I(className="bi bi-files"), " Batch summarize sections"], color="secondary", className="w-fit"),
+            id="batch_upload_btn",
+            accept=".xlsx, .html, .htm, .trf, .txt",
+            multiple=True,
+            className="!w-fit",
+        ),
+        dbc.Input(id="batch_best", type="number", min=1, step=1, placeholder="Best N sections", className="w-48"),
+        dcc.Dropdown(
+            id="tie_breaks",
+            options=[{"label": v, "value": k} for k, v in TIE_BREAKS.items()],
+            value=DEFAULT_TIE_BREAKS,
+            multi=True,
+            placeholder="Tie-breaks for TRF files",
+            className="w-fit min-w-96",
+        ),
+    ], className="flex flex-row gap-2 p-0 m-0 flex-nowrap"),
+    html.Div(id="batch_result", className="w-full"),
     table(
         id="table_summarize",
         columns=[{
@@ -100,14 +153,50 @@ layout = dbc.Container([
         ),
     ]),
     dbc.Container([
-        dcc.Graph(figure=px.bar(), id="graph_summarize", className="w-full inline-block"),
+        dbc.Label("Chart:"),
+        dbc.Row([
+            dbc.Input(
+                id="chart_top",
+                type="number",
+                value=CHART_TEAMS,
+                min=1,
+                step=1,
+                placeholder="All teams",
+                className="w-24",
+            ),
+            dbc.Checklist(
+                id="chart_series",
+                options=[{"label": v, "value": k} for k, v in SERIES.items()],
+                value=list(SERIES),
+                inline=True,
+                className="w-fit my-auto",
+            ),
+        ], className="flex flex-row gap-2 p-0 m-0"),
+    ]),
+    dcc.Store("summary_client_id"),
+    dbc.Container([
+        dcc.Graph(figure=summary_figure(), id="graph_summarize", className="w-full inline-block"),
     ], className="w-full"),
-    dbc.DropdownMenu([
-        dbc.DropdownMenuItem(
-            "Export to excel", id="export", n_clicks=0, className="me-1"
+    dbc.Row([
+        dbc.DropdownMenu([
+            dbc.DropdownMenuItem(
+                "Export to excel", id="export", n_clicks=0, className="me-1"
+            ),
+        ], label="Export", class_name="p-0 w-fit", id="export_menu"),
+        dbc.Button([html.I(className="bi bi-x-circle"), " Cancel"], id="export_cancel_btn", color="danger", size="sm", className="hidden", n_clicks=0),
+        dbc.Checklist(
+            options=[
+                {"label": "Player detail", "value": "players"},
+                {"label": "Raw standings", "value": "standings"},
+                {"label": "Settings", "value": "settings"},
+            ],
+            value=[],
+            id="export_sheets",
+            inline=True,
+            className="w-fit text-sm my-auto",
         ),
-    ], label="Export", class_name="p-0", id="export_menu"),
-    dash.dcc.Download(id="download-text"),
+    ], className="flex flex-row gap-2 p-0 m-0"),
+    dcc.Store("summary_download_url"),
 ], className="flex flex-col gap-2 p-0")
 
 
@@ -121,12 +210,37 @@ def change_data(data):
         data = [{"": 1}]
         return data
 
-    data = [
+    rows = [
         row for row in data if row.get("rank") or row.get("no") or row.get("name") or row.get("team")
     ]
 
-    data.append({"": 1})
-    return data
+    rows.append({"": 1})
+    # the table echoes every edit back here, only answer when rows were actually dropped or added
+    return table_patch(data, rows)
+
+
+@dash.callback(
+    Output("table_summarize", "data", allow_duplicate=True),
+    Output("standings_import_status", "children"),
+    Output("standings_upload_btn", "contents"),
+    Input("standings_upload_btn", "contents"),
+    State("standings_upload_btn", "filename"),
+    State("tie_breaks", "value"),
+    prevent_initial_call=True,
+)
+def import_standings(contents, filename, tie_breaks):
+    if not contents or not filename:
+        raise PreventUpdate
+
+    content_type, content_string = contents.split(',')
+    try:
+        data = standings.read_standings(base64.b64decode(content_string), filename, tie_breaks)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return dash.no_update, f"Could not read {filename}: {e}", None
+    if not data:
+        return dash.no_update, f"No standings found in {filename}", None
+
+    return data + [{"": 1}], f"Imported {len(data)} rows from {filename}", None
 
 
 @dash.callback(
@@ -140,154 +254,160 @@ def update_table_group_summarize(data):
     if not data:
         data = [{"": 1}]
         return data, True, True
-    data = [
+    rows = [
         row for row in data if row.get("longName") or row.get("shortName")
     ]
-    data.append({"": 1})
+    rows.append({"": 1})
 
-    return data, False, False
+    return table_patch(data, rows), False, False
 
 
 @dash.callback(
     Output("table_summarize", "data", allow_duplicate=True),
+    Output("replace_unresolved", "children"),
     Input("replace_lts", "n_clicks"),
     Input("replace_stl", "n_clicks"),
-    Input("table_group_summarize", "data"),
-    Input("table_summarize", "data"),
+    State("table_group_summarize", "data"),
+    State("table_summarize", "data"),
+    State("replace_fuzzy", "value"),
     prevent_initial_call=True,
 )
-def replace_team_name(n_lts, n_stl, team_data, data):
-    if dash.ctx.triggered_id == "table_summarize":
-        raise PreventUpdate
-
+def replace_team_name(n_lts, n_stl, team_data, data, fuzzy):
     if dash.ctx.triggered_id == "replace_lts":
         team_data = {row["longName"]: row["shortName"] for row in team_data if row.get("longName") and row.get("shortName")}
-        for row in data:
-            if not row.get("team"):
-                continue
-            row["team"] = team_data.get(row["team"], row["team"])
     elif dash.ctx.triggered_id == "replace_stl":
         team_data = {row["shortName"]: row["longName"] for row in team_data if row.get("longName") and row.get("shortName")}
-        for row in data:
-            if not row.get("team"):
-                continue
-            row["team"] = team_data.get(row["team"], row["team"])
     else:
         raise PreventUpdate
 
-    return data
-
-
-def generate_summary(data, sort_by: Literal["rank", "score"] = "rank", top=3):
-    result = {}
-    for i, row in enumerate(data):
-        if not row.get("rank") and not row.get("no") and not row.get("name") and not row.get("team"):
-            continue
-
-        if row.get("rank") == "":
-            row["rank"] = data[i - 1]["rank"] if i > 0 else 1
-
-        team = row["team"]
-        if team not in result:
-            result[team] = {"players": [], "rank": 0, "score": 0, "tb1": 0, "tb2": 0, "tb3": 0, "tb4": 0, "tb5": 0}
-        result[team]["players"].append({k: parse_number(v) if k in ["rank", "score", "tb1", "tb2", "tb3", "tb4", "tb5"] else v for k, v in row.items()})
-
-    for team in result:
-        if sort_by == "rank":
-            result[team]["players"] = sorted(result[team]["players"], key=itemgetter("rank"))[:top]
-        elif sort_by == "score":
-            result[team]["players"] = sorted(result[team]["players"], key=lambda x: (x["score"], 99999 - x["rank"]), reverse=True)[:top]
+    original = copy.deepcopy(data)
+    data, unresolved = team_names.replace_team_names(data, team_data, fuzzy=bool(fuzzy))
 
-    for team in result:
-        result[team]["rank"] = sum(player["rank"] for player in result[team]["players"])
-        result[team]["score"] = sum(player["score"] for player in result[team]["players"])
-        result[team]["tb1"] = sum(player["tb1"] for player in result[team]["players"])
-        result[team]["tb2"] = sum(player["tb2"] for player in result[team]["players"])
-        result[team]["tb3"] = sum(player["tb3"] for player in result[team]["players"])
-        result[team]["tb4"] = sum(player["tb4"] for player in result[team]["players"])
-        result[team]["tb5"] = sum(player["tb5"] for player in result[team]["players"])
-
-    return result
+    return table_patch(original, data), f"Unresolved: {', '.join(unresolved)}" if unresolved else ""
 
 
 @dash.callback(
     Output("graph_summarize", "figure"),
+    Output("summary_client_id", "data"),
     Input("table_summarize", "data"),
     Input("sort_by", "value"),
     Input("top", "value"),
+    Input("chart_top", "value"),
+    Input("chart_series", "value"),
+    State("summary_client_id", "data"),
     prevent_initial_call=True,
 )
-def update_graph(data, sort_by: Literal["rank", "score"] = "rank", top: int = 2):
+def update_graph(data, sort_by: Literal["rank", "score"] = "rank", top: int = 2, chart_top: int = CHART_TEAMS, series=(), client_id=None):
     if not data:
         raise PreventUpdate
 
-    summary_data = generate_summary(data, sort_by=sort_by, top=top)
-    graph_data = pandas.DataFrame(columns=["team", "rank", "score", "tb1", "tb2", "tb3", "tb4", "tb5"])
-    for team, values in sorted(summary_data.items(), key=lambda x: (len(x[1]["players"]), 99999 - x[1]["rank"], x[1]["score"], x[1]["tb1"], x[1]["tb2"], x[1]["tb3"], x[1]["tb4"], x[1]["tb5"]) if sort_by == "rank" else (len(x[1]["players"]), x[1]["score"], 99999 - x[1]["rank"], x[1]["tb1"], x[1]["tb2"], x[1]["tb3"], x[1]["tb4"], x[1]["tb5"]), reverse=True):
-        graph_data = pandas.concat([graph_data, pandas.DataFrame([{
-            "team": team,
-            "rank": values["rank"],
-            "score": values["score"],
-            "tb1": values["tb1"],
-            "tb2": values["tb2"],
-            "tb3": values["tb3"],
-            "tb4": values["tb4"],
-            "tb5": values["tb5"],
-        }])], ignore_index=True)
-
-    fig = px.bar(
-        graph_data,
-        x="team",
-        y=["rank", "score", "tb1", "tb2", "tb3", "tb4", "tb5"] if sort_by == "rank" else ["score", "rank", "tb1", "tb2", "tb3", "tb4", "tb5"],
-        barmode="group",
-        title="Summary of teams",
-        labels={"value": "Value", "team": "Team"},
-        color_discrete_sequence=px.colors.qualitative.Plotly,
-    )
+    if not client_id:
+        client_id = random_string(12)
+    teams, values = chart_data(incremental_rank_teams(client_id, data, sort_by=sort_by, top=top), chart_top, SERIES)
+    webgl = len(teams) > WEBGL_THRESHOLD
+
+    fig = Patch()
+    for i, k in enumerate(SERIES):
+        # hidden series are not sent at all instead of being shipped as legendonly
+        shown = k in (series or ())
+        fig["data"][i]["type"] = "scattergl" if webgl else "bar"
+        # bars have no mode, a leftover one from the scatter would stay on the trace
+        fig["data"][i]["mode"] = "markers" if webgl else None
+        fig["data"][i]["x"] = teams if shown else []
+        fig["data"][i]["y"] = values[k] if shown else []
+        fig["data"][i]["visible"] = shown
+
+    return fig, client_id
 
-    return fig
+
+def save_job_result(f, filename: str) -> str:
+    path, url = jobs.job_file(filename)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(f, out)
+    return url
 
 
 @dash.callback(
-    Output("download-text", "data"),
+    Output("summary_download_url", "data", allow_duplicate=True),
     Input("export", "n_clicks"),
-    Input("table_summarize", "data"),
-    Input("sort_by", "value"),
-    Input("top", "value"),
+    State("table_summarize", "data"),
+    State("sort_by", "value"),
+    State("top", "value"),
+    State("export_sheets", "value"),
+    State("summary_client_id", "data"),
+    background=True,
+    running=[
+        (Output("export_menu", "disabled"), True, False),
+        (Output("export_cancel_btn", "className"), "w-fit", "hidden"),
+    ],
+    cancel=[Input("export_cancel_btn", "n_clicks")],
     prevent_initial_call=True,
 )
-def export_to_excel(n_clicks, data, sort_by: Literal["rank", "score"] = "rank", top: int = 2):
-    if not data or dash.ctx.triggered_id != "export":
+def export_to_excel(n_clicks, data, sort_by: Literal["rank", "score"] = "rank", top: int = 2, sheets=(), client_id=None):
+    if not data or not n_clicks:
         raise PreventUpdate
 
-    summary_data = generate_summary(data, sort_by=sort_by, top=top)
+    # the job is forked from the worker that drew the chart, so its incremental state is usually already up to date
+    ranked = incremental_rank_teams(client_id, data, sort_by=sort_by, top=top) if client_id else None
+    with export_summary(data, sort_by=sort_by, top=top, sheets=sheets or (), ranked=ranked) as f:
+        return save_job_result(f, "summary.xlsx")
 
-    def styled_cells(d):
-        for c in d:
-            c = Cell(ws, column=1, row=1, value=c)
-            c.font = Font(bold=True)
-            c.fill = PatternFill(start_color="BFBFBF", end_color="BFBFBF", fill_type="solid")
-            yield c
 
-    wb = Workbook()
-    ws = wb.active
-    if sort_by == "rank":
-        ws.append(["Rank", "Team", "Total Rank", "Score", "TB1", "TB2", "TB3", "TB4", "TB5"])
-    else:
-        ws.append(["Rank", "Team", "Score", "Total Rank", "TB1", "TB2", "TB3", "TB4", "TB5"])
-    i = 1
-    for team, values in sorted(summary_data.items(), key=lambda x: (len(x[1]["players"]), 99999 - x[1]["rank"], x[1]["score"], x[1]["tb1"], x[1]["tb2"], x[1]["tb3"], x[1]["tb4"], x[1]["tb5"]) if sort_by == "rank" else (len(x[1]["players"]), x[1]["score"], 99999 - x[1]["rank"], x[1]["tb1"], x[1]["tb2"], x[1]["tb3"], x[1]["tb4"], x[1]["tb5"]), reverse=True):
-        ws.append(styled_cells(map(lambda x: f'{x:g}' if isinstance(x, float) else str(x), [i, team, values["rank"], values["score"], values["tb1"], values["tb2"], values["tb3"], values["tb4"], values["tb5"]] if sort_by == "rank" else [i, team, values["score"], values["rank"], values["tb1"], values["tb2"], values["tb3"], values["tb4"], values["tb5"]])))
-        for j, player in enumerate(values["players"]):
-            ws.append(list(map(lambda x: f'{x:g}' if isinstance(x, float) else str(x), [j+1, player["name"], player["rank"], player["score"], player["tb1"], player["tb2"], player["tb3"], player["tb4"], player["tb5"]] if sort_by == "rank" else [j+1, player["name"], player["score"], player["rank"], player["tb1"], player["tb2"], player["tb3"], player["tb4"], player["tb5"]])))
-
-        i += 1
-
-    autofit_columns(ws)
-
-    virtual_workbook = BytesIO()
-    wb.save(virtual_workbook)
-    return dcc.send_bytes(
-        virtual_workbook.getvalue(),
-        filename="summary.xlsx",
-    )
\ No newline at end of file
+@dash.callback(
+    Output("summary_download_url", "data", allow_duplicate=True),
+    Output("batch_result", "children"),
+    Output("batch_upload_btn", "contents"),
+    Input("batch_upload_btn", "contents"),
+    State("batch_upload_btn", "filename"),
+    State("sort_by", "value"),
+    State("top", "value"),
+    State("batch_best", "value"),
+    State("tie_breaks", "value"),
+    background=True,
+    running=[
+        (Output("batch_upload_btn", "disabled"), True, False),
+    ],
+    prevent_initial_call=True,
+)
+def batch_summarize(contents, filenames, sort_by: Literal["rank", "score"] = "rank", top: int = 2, best=None, tie_breaks=None):
+    if not contents or not filenames:
+        raise PreventUpdate
+
+    files = [(filename, base64.b64decode(content.split(',')[1])) for filename, content in zip(filenames, contents)]
+    try:
+        sections = read_sections(files, tie_breaks=tie_breaks)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return dash.no_update, f"Could not read {e}", None
+
+    ranked, overall = aggregate_sections(sections, sort_by=sort_by, top=top, best=best)
+    with write_sections(ranked, overall, sort_by=sort_by) as f:
+        download = save_job_result(f, "summary_sections.xlsx")
+
+    return download, dash.dash_table.DataTable(
+        id="batch_result_table",
+        columns=[{"name": v, "id": k} for k, v in {
+            "place": "Rank",
+            "team": "Team",
+            "gold": "Gold",
+            "silver": "Silver",
+            "bronze": "Bronze",
+            "score": "Score",
+            "sections": "Sections",
+        }.items()],
+        data=overall.to_dict(orient="records"),
+        style_cell={'textAlign': 'left'},
+        style_table={"width": "fit-content"},
+    ), None
+
+
+clientside_callback(
+    """
+    function(url) {
+        if (url) {
+            window.location.href = url;
+        }
+    }
+    """,
+    Input("summary_download_url", "data"),
+    prevent_initial_call=True,
+)
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from core import players, rating_list
+from core.cards import card_base, render_card, card_filename
+from core.standings import read_standings
+from core.summary import export_sections, unique_section_name
+from core.tie_breaks import TIE_BREAKS, DEFAULT_TIE_BREAKS
+from utils import ensure_folder
+
+PLAYER_EXTENSIONS = (".xlsx", ".xlsm", ".xls", ".csv")
+STANDINGS_EXTENSIONS = (".html", ".htm", ".trf", ".txt")
+CARD_TEMPLATE = "./static/card_template.png"
+
+
+def input_files(folder: str) -> list[str]:
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(PLAYER_EXTENSIONS + STANDINGS_EXTENSIONS) and not name.startswith(("~$", "."))
+    )
+
+
+def prepare_players(df, options) -> tuple[list[dict], list[dict]]:
+    mapping = players.guess_columns(df.columns, dict(options.column))
+    if "Name" not in mapping.values():
+        raise ValueError(f"No name column among {', '.join(map(str, df.columns))}")
+    data = [row for row in players.rename_columns(df, mapping) if row.get("Name", None)]
+
+    # same steps and order as editing the table in the UI
+    if options.formula:
+        data.append(dict(options.formula))
+    data = players.apply_formulas(players.normalize_players(data))
+    data = [row for row in data if row.get("Name", None)]
+
+    if options.fill_group:
+        players.fill_groups(data)
+    if options.fill_rating and rating_list.index_exists():
+        rating_list.auto_fill(data)
+    teams = players.teams_from_players(data)
+    if options.fill_team:
+        players.fill_from_teams(data, teams, "Federation", "TeamUniqueId")
+    return data, teams
+
+
+def write_players(data: list[dict], teams: list[dict], folder: str, options) -> list[str]:
+    written = {
+        "players.xml": players.generate_players_xml(data).encode("utf-8"),
+        "players.xlsx": players.export_players(data),
+    }
+    for group in players.group_counts(data):
+        written[f"{group}.xml"] = players.generate_players_xml(data, group=group).encode("utf-8")
+    if teams:
+        written["teams.xml"] = players.generate_teams_xml(teams).encode("utf-8")
+
+    for name, content in written.items():
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(content)
+
+    if options.card_config:
+        with open(options.card_config, encoding="utf-8") as f:
+            config = json.load(f)
+        base = card_base(options.card_template, config.get("config", {}))
+        with zipfile.ZipFile(os.path.join(folder, "player_cards.zip"), mode="w", compression=zipfile.ZIP_STORED) as zf:
+            for row in data:
+                zf.writestr(card_filename(config, row), render_card(base, config, row))
+        written["player_cards.zip"] = None
+
+    return list(written)
+
+
+def process_file(path: str, options) -> dict:
+    name = os.path.splitext(os.path.basename(path))[0]
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        content = f.read()
+
+    if not path.lower().endswith(PLAYER_EXTENSIONS):
+        rows = read_standings(content, path, options.tie_breaks)
+        return {"file": path, "name": name, "kind": "standings", "rows": rows, "count": len(rows), "seconds": time.perf_counter() - started}
+
+    # Swiss-Manager rankings exported to Excel are standings, anything else is a player list
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        rows = read_standings(content, path, options.tie_breaks)
+        if rows:
+            return {"file": path, "name": name, "kind": "standings", "rows": rows, "count": len(rows), "seconds": time.perf_counter() - started}
+
+    data, teams = prepare_players(players.read_players(content, path, options.sheet), options)
+    folder = os.path.join(options.output, name)
+    shutil.rmtree(folder, ignore_errors=True)
+    files = write_players(data, teams, ensure_folder(folder), options)
+    return {
+        "file": path, "name": name, "kind": "players", "players": len(data), "teams": len(teams),
+        "duplicates": sum(row.get("duplicate") == "true" for row in data), "files": files,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def safe_process_file(path: str, options) -> dict:
+    # one broken file should not take the other sections down with it
+    try:
+        return process_file(path, options)
+    except Exception as e:
+        return {"file": path, "name": os.path.splitext(os.path.basename(path))[0], "kind": "error", "error": f"{type(e).__name__}: {e}"}
+
+
+def run(options) -> list[dict]:
+    files = input_files(options.input)
+    if len(files) <= 1 or options.jobs == 1:
+        results = [safe_process_file(path, options) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(files), options.jobs or os.cpu_count() or 1)) as executor:
+            results = list(executor.map(safe_process_file, files, [options] * len(files)))
+
+    sections = {}
+    for result in results:
+        if result["kind"] != "standings" or not result["rows"]:
+            continue
+        sections[unique_section_name(sections, result["name"])] = result.pop("rows")
+    if sections:
+        f = export_sections(sections, sort_by=options.sort_by, top=options.top, best=options.best)
+        with open(os.path.join(ensure_folder(options.output), "summary.xlsx"), "wb") as out:
+            shutil.copyfileobj(f, out)
+        f.close()
+    return results
+
+
+def report(results: list[dict]) -> str:
+    lines = []
+    for result in results:
+        match result["kind"]:
+            case "players":
+                lines.append(f"{result['file']}: {result['players']} players, {result['teams']} teams, "
+                             f"{result['duplicates']} duplicates -> {', '.join(result['files'])} ({result['seconds']:.1f}s)")
+            case "standings":
+                lines.append(f"{result['file']}: {result['count']} standings rows -> summary.xlsx ({result['seconds']:.1f}s)")
+            case _:
+                lines.append(f"{result['file']}: {result['error']}")
+    return "\n".join(lines)
+
+
+def column(value: str) -> tuple[str, str]:
+    header, _, field = value.rpartition("=")
+    if field not in players.IMPORT_FIELDS or not header:
+        raise argparse.ArgumentTypeError(f"expected HEADER=FIELD with FIELD one of {', '.join(players.IMPORT_FIELDS)}")
+    return header, field
+
+
+def formula(value: str) -> tuple[str, str]:
+    field, _, template = value.partition("=")
+    if field not in players.FIELDS or not template:
+        raise argparse.ArgumentTypeError(f"expected FIELD=TEMPLATE with FIELD one of {', '.join(players.FIELDS)}")
+    return field, f"={template}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prepare Swiss-Manager files for every section in a folder without the UI.")
+    parser.add_argument("input", help="folder with player lists (.xlsx/.xls/.csv) and standings (.xlsx/.html/.trf)")
+    parser.add_argument("-o", "--output", default="./output", help="one sub folder per player list, summary.xlsx for the standings")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--sheet", default=None, help="sheet to read from player workbooks, the first one by default")
+    parser.add_argument("--column", type=column, action="append", default=[], metavar="HEADER=FIELD",
+                        help="read a column the headers do not name, e.g. 'Ho va ten lot=Name'")
+    parser.add_argument("--formula", type=formula, action="append", default=[], metavar="FIELD=TEMPLATE",
+                        help="fill a column from a mako template, like the formula row in the UI, e.g. Type='${rating}'")
+    parser.add_argument("--fill-group", action="store_true", help="derive the group from the gender column")
+    parser.add_argument("--fill-rating", action="store_true", help="fill rating, title and FIDE id from the indexed rating list")
+    parser.add_argument("--fill-team", action="store_true", help="number teams by federation and fill the team id")
+    parser.add_argument("--card-config", default=None, help="card config exported from the UI, cards are skipped without it")
+    parser.add_argument("--card-template", default=CARD_TEMPLATE, help="card background image")
+    parser.add_argument("--sort-by", choices=("rank", "score"), default="rank")
+    parser.add_argument("--top", type=int, default=3, help="players counted per team")
+    parser.add_argument("--best", type=int, default=None, help="sections counted per team in the overall table")
+    parser.add_argument("--tie-breaks", nargs="+", choices=list(TIE_BREAKS), default=DEFAULT_TIE_BREAKS,
+                        help="tie-breaks computed for TRF files")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not os.path.isdir(args.input):
+        print(f"{args.input} is not a folder")
+        sys.exit(1)
+    results = run(args)
+    print(report(results))
+    sys.exit(1 if any(result["kind"] == "error" for result in results) else 0)
@@ -0,0 +1,29 @@
+import hashlib
+import os
+import re
+
+from utils import TEMP_FOLDER, ensure_folder
+
+PREVIEW_PREFIX = "preview_"
+PREVIEW_URL = "/preview"
+PREVIEW_TYPES = {"jpg": "image/jpeg", "png": "image/png"}
+DIGEST_PATTERN = re.compile(r"[0-9a-f]{40}")
+
+
+def preview_url(data: bytes, ext: str) -> str:
+    # files are named after their content, an unchanged preview keeps its url and stays in the browser cache
+    digest = hashlib.sha1(data).hexdigest()
+    path = os.path.join(ensure_folder(TEMP_FOLDER), f"{PREVIEW_PREFIX}{digest}.{ext}")
+    if not os.path.isfile(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return f"{PREVIEW_URL}/{digest}.{ext}"
+
+
+def preview_file(digest: str, ext: str) -> str | None:
+    if not DIGEST_PATTERN.fullmatch(digest) or ext not in PREVIEW_TYPES:
+        return None
+    path = os.path.join(TEMP_FOLDER, f"{PREVIEW_PREFIX}{digest}.{ext}")
+    return path if os.path.isfile(path) else None
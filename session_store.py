@@ -0,0 +1,116 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SESSION_FOLDER = "./sessions"
+SESSION_DB = os.environ.get("SESSION_DB", os.path.join(SESSION_FOLDER, "sessions.sqlite"))
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
+
+# a writer holding the lock in another worker is waited for instead of failing
+BUSY_TIMEOUT = 10.0
+
+
+class SessionConflict(ValueError):
+    pass
+
+
+class SqliteSessionStore:
+    def __init__(self, path: str = SESSION_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        con = self._connection()
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "client_id TEXT NOT NULL, kind TEXT NOT NULL, version INTEGER NOT NULL,"
+            "updated_at REAL NOT NULL, data TEXT NOT NULL, PRIMARY KEY (client_id, kind)) WITHOUT ROWID"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections must not be shared between threads
+        # nor inherited by a forked worker
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            con.execute("PRAGMA journal_mode = WAL")
+            con.execute("PRAGMA synchronous = NORMAL")
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def get(self, client_id: str, kind: str, default=None):
+        return self.get_versioned(client_id, kind, default)[1]
+
+    def get_versioned(self, client_id: str, kind: str, default=None) -> tuple[int, object]:
+        row = self._connection().execute(
+            "SELECT version, data FROM sessions WHERE client_id = ? AND kind = ?", (client_id, kind)
+        ).fetchone()
+        if row is None:
+            return 0, default
+        return row[0], json.loads(row[1])
+
+    def put(self, client_id: str, kind: str, value, expected_version: int | None = None) -> int:
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        con = self._connection()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = con.execute(
+                "SELECT version FROM sessions WHERE client_id = ? AND kind = ?", (client_id, kind)
+            ).fetchone()
+            version = row[0] if row else 0
+            if expected_version is not None and expected_version != version:
+                raise SessionConflict(f"Session {client_id}/{kind} is at version {version}, expected {expected_version}")
+            con.execute(
+                "INSERT INTO sessions (client_id, kind, version, updated_at, data) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (client_id, kind) DO UPDATE SET "
+                "version = excluded.version, updated_at = excluded.updated_at, data = excluded.data",
+                (client_id, kind, version + 1, time.time(), data),
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return version + 1
+
+    def update(self, client_id: str, kind: str, fn, default=None, retries: int = 3):
+        for _ in range(retries):
+            version, value = self.get_versioned(client_id, kind, default)
+            value = fn(value)
+            try:
+                self.put(client_id, kind, value, expected_version=version)
+                return value
+            except SessionConflict:
+                continue
+        raise SessionConflict(f"Session {client_id}/{kind} kept changing")
+
+    def values(self, kind: str):
+        for (data,) in self._connection().execute("SELECT data FROM sessions WHERE kind = ?", (kind,)):
+            yield json.loads(data)
+
+    def prune(self, max_age: float) -> int:
+        cursor = self._connection().execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,))
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        con = self._connection()
+        count, clients = con.execute("SELECT COUNT(*), COUNT(DISTINCT client_id) FROM sessions").fetchone()
+        return {"backend": "sqlite", "path": self.path, "rows": count, "clients": clients}
+
+
+STORE_BACKENDS = {
+    "sqlite": SqliteSessionStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = STORE_BACKENDS[SESSION_BACKEND]()
+        return _store
@@ -0,0 +1,9 @@
+/** @type {import('tailwindcss').Config} */
+module.exports = {
+  // class names live in python strings of the dash layouts
+  content: ["./app.py", "./pages/**/*.py", "./components/**/*.py"],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
@@ -0,0 +1,87 @@
+import copy
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROWS = 500
+# one edited cell plus the group menu and summary table, the full table is ~90 KB
+PATCH_BUDGET = 4096
+
+
+@pytest.fixture(scope="module")
+def dash_app(tmp_path_factory):
+    # read at import time, so they have to be set before the app is imported
+    folder = tmp_path_factory.mktemp("app")
+    cwd = os.getcwd()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("TEMP_FOLDER", str(folder / "temp"))
+        mp.setenv("FONTS_FOLDER", str(folder / "fonts"))
+        mp.setenv("SESSION_DB", str(folder / "sessions.sqlite"))
+        mp.setenv("JOBS_CACHE", str(folder / "jobs"))
+        mp.setenv("JANITOR_INTERVAL", "0")
+        os.chdir(ROOT)
+        try:
+            import app
+            client = app.server.test_client()
+            # pages register their callbacks on the first request
+            client.get("/xml")
+            yield app.app, client
+        finally:
+            os.chdir(cwd)
+
+
+def callbacks_with_input(dash_app, component_id, prop):
+    return {
+        getattr(callback.get("callback"), "__name__", None)
+        for callback in dash_app.callback_map.values()
+        if any(i["id"] == component_id and i["property"] == prop for i in callback["inputs"])
+    }
+
+
+def players_table():
+    from core import players
+
+    rows = [{"Name": f"Player {i}", "Gender": "f" if i % 2 else "m", "Federation": "VIE", "Group": ""} for i in range(ROWS)]
+    data = players.apply_formulas(players.normalize_players(rows))
+    data.append({k: "" for k in players.FIELDS.keys()})
+    return data
+
+
+def test_only_change_data_listens_to_table(dash_app):
+    app, _ = dash_app
+    assert callbacks_with_input(app, "table", "data") == {"change_data"}
+    assert callbacks_with_input(app, "table_group", "data") == {"change_data"}
+
+
+def test_cell_edit_returns_patch(dash_app):
+    app, client = dash_app
+    key, callback = next(
+        (key, callback) for key, callback in app.callback_map.items()
+        if any(i["id"] == "table" and i["property"] == "data" for i in callback["inputs"])
+    )
+
+    data = players_table()
+    edited = copy.deepcopy(data)
+    # the server derives Lastname and Firstname from the edited name
+    edited[10]["Name"] = "Nguyen Van A"
+
+    outputs = [{"id": output.split(".")[0], "property": output.split(".")[1].split("@")[0]}
+               for output in key.strip(".").split("...")]
+    response = client.post("/_dash-update-component", json={
+        "output": key,
+        "outputs": outputs,
+        "inputs": [{"id": "table", "property": "data", "value": edited}],
+        "state": [{"id": s["id"], "property": s["property"], "value": [{}] if s["id"] == "generate_menu" else None}
+                  for s in callback["state"]],
+        "changedPropIds": ["table.data"],
+    })
+
+    assert response.status_code == 200
+    table = response.get_json()["response"]["table"]["data"]
+    assert table["__dash_patch_update"] == "__dash_patch_update"
+    assert {op["location"][0] for op in table["operations"]} == {10}
+    assert len(response.data) < PATCH_BUDGET
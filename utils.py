@@ -1,12 +1,52 @@
 import base64
 import copy
+import importlib
+import json
+import os
 import random
 import re
 import string
+import unicodedata
 from io import BytesIO
 
 from PIL import Image
 
+TEMP_FOLDER = os.environ.get("TEMP_FOLDER", "./temp")
+FONTS_FOLDER = os.environ.get("FONTS_FOLDER", "./fonts")
+BUILD_FOLDER = "./static/build"
+ASSET_MANIFEST = os.path.join(BUILD_FOLDER, "manifest.json")
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+pandas = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+
+
+def read_asset_manifest(path: str = ASSET_MANIFEST) -> dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {name: f"/static/build/{target}" for name, target in json.load(f).items()}
+
+
+def ensure_folder(folder: str) -> str:
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
 
 def parse_number(number_str: str):
     if isinstance(number_str, (int, float)):
@@ -20,6 +60,15 @@ def parse_number(number_str: str):
     return float(number_str.replace(",", ".").replace(" ", "").replace("'", ""))
 
 
+def parse_numbers(series: "pandas.Series") -> "pandas.Series":
+    # standings columns repeat a handful of values, so only the distinct ones are parsed
+    codes, uniques = pandas.factorize(series.fillna(""))
+    values = pandas.to_numeric(pandas.Series(uniques, dtype=object), errors="coerce")
+    for i in values.index[values.isna()]:
+        values[i] = parse_number(uniques[i])
+    return pandas.Series(values.to_numpy(dtype=float)[codes], index=series.index)
+
+
 def autofit_columns(ws):
     for column in ws.columns:
         max_length = 0
@@ -34,6 +83,23 @@ def autofit_columns(ws):
         ws.column_dimensions[column_letter].width = adjusted_width
 
 
+def column_widths(rows, widths: list | None = None) -> list:
+    widths = list(widths or [])
+    for row in rows:
+        for i, value in enumerate(row):
+            length = len(str(value)) if value is not None else 0
+            if i >= len(widths):
+                widths.append(length)
+            elif length > widths[i]:
+                widths[i] = length
+    return widths
+
+
+def set_column_widths(ws, widths):
+    for i, width in enumerate(widths):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(i + 1)].width = width + 3
+
+
 def merge_dict(obj, template):
     obj = copy.deepcopy(obj) if isinstance(obj, dict) else {}
     for key, value in template.items():
@@ -45,6 +111,28 @@ def merge_dict(obj, template):
     return obj
 
 
+def table_patch(old: list[dict], new: list[dict]):
+    from dash import Patch, no_update
+
+    # a row added or removed shifts every index after it, resend the table
+    if len(old) != len(new):
+        return new
+
+    patch = Patch()
+    changed = False
+    for i, (old_row, new_row) in enumerate(zip(old, new)):
+        if old_row == new_row:
+            continue
+        changed = True
+        for key, value in new_row.items():
+            if key not in old_row or old_row[key] != value:
+                patch[i][key] = value
+        for key in old_row.keys() - new_row.keys():
+            del patch[i][key]
+
+    return patch if changed else no_update
+
+
 def base64_to_pil(base64_str: str, mode: str = "RGB"):
     base64_string = re.sub('^data:image/.+;base64,', '', base64_str)
     image_data = base64.b64decode(base64_string)
@@ -66,6 +154,11 @@ def contains_mako_syntax(s):
     return any(re.search(pattern, s, re.MULTILINE | re.DOTALL) for pattern in mako_patterns)
 
 
+def fold_text(text) -> str:
+    text = unicodedata.normalize("NFKD", str(text or "")).replace("đ", "d").replace("Đ", "D")
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).casefold().split())
+
+
 def hex_to_rgb(hex_color: str) -> tuple:
     hex_color = hex_color.lstrip('#')
     if len(hex_color) == 3:  # shorthand hex